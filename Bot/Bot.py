@@ -10,58 +10,57 @@ Features:
 - Multi-step tokenomics setup
 """
 
-import os
 import logging
-import sqlite3
-from datetime import datetime
-from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
-from web3 import Web3
-from PIL import Image
-import io
-import requests
-import json
-import random
-import string
-import asyncio
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+
+from Bot.Config import TELEGRAM_TOKEN, PERSISTENCE_PATH
+from Bot.Utils.Logger import setup_logging
+
+# Configure logging once for every module, before the handlers and utilities
+# below are imported so their import-time messages use the same format
+setup_logging()
 
 # Import handlers and utilities
-from Bot.Handlers.Create_Handlers import setup_create_handlers
-from Bot.Handlers.Payment_Handlers import setup_payment_handlers
+from Bot.Handlers.Create_Handlers import setup_create_handlers, SessionPersistence
+from Bot.Handlers.Payment_Handlers import setup_payment_handlers, reconcile_pending_unlocks
 from Bot.Handlers.Utility_Handlers import setup_utility_handlers
-from Bot.Utils.Image_Processor import compress_image
-from Bot.Utils.BlockChain import deploy_contract, unlock_trading, submit_cmc
-from Bot.Utils.Database import setup_database, get_user_coin, update_coin_status
-
-# Load environment variables
-load_dotenv()
+from Bot.Utils.BlockChain import open_rpc_session, close_rpc_session
+from Bot.Utils.Database import setup_database
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Bot configuration
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-BSC_RPC_URL = os.getenv("BSC_RPC_URL", "https://bsc-dataseed.binance.org/")
-BSC_API_KEY = os.getenv("BSC_API_KEY")
-DEV_WALLET = os.getenv("DEV_WALLET")
-MARKETING_WALLET = os.getenv("MARKETING_WALLET")
-LIQUIDITY_WALLET = os.getenv("LIQUIDITY_WALLET")
-DEPLOYER_PRIVATE_KEY = os.getenv("DEPLOYER_PRIVATE_KEY")
-
-# Pricing in BNB
-UNLOCK_PRICE = 0.05
-CMC_PRICE = 0.5
+# Static command replies
+START_TEMPLATE = (
+    "Hi {mention}! 👋\n\n"
+    "Welcome to the Memecoin Generator Bot! 🚀\n\n"
+    "I can help you create your own memecoin on Binance Smart Chain.\n\n"
+    "Commands:\n"
+    "/createfree - Create a free untradeable coin\n"
+    "/unlock - Pay 0.05 BNB to enable trading\n"
+    "/cmc - Pay 0.5 BNB for CMC listing submission\n"
+    "/help - Show this help message"
+)
 
-# Initialize Web3
-w3 = Web3(Web3.HTTPProvider(BSC_RPC_URL))
+HELP_TEXT = (
+    "🚀 *Memecoin Generator Bot Help* 🚀\n\n"
+    "*Commands:*\n"
+    "/createfree - Create a free untradeable coin\n"
+    "/unlock - Pay 0.05 BNB to enable trading\n"
+    "/cmc - Pay 0.5 BNB for CMC listing submission\n"
+    "/help - Show this help message\n\n"
+    "*How it works:*\n"
+    "1. Use /createfree to create your coin\n"
+    "2. Follow the steps to set up your tokenomics\n"
+    "3. Upload a logo for your coin\n"
+    "4. Get your contract deployed (trading locked)\n"
+    "5. Use /unlock to enable trading for 0.05 BNB\n"
+    "6. Use /cmc to submit to CoinMarketCap for 0.5 BNB\n\n"
+    "*Note:* All payments are in BNB on the Binance Smart Chain."
+)
 
-# User session storage
-user_data = {}
+# Long polling: Telegram holds getUpdates open for up to this many seconds
+POLLING_TIMEOUT = 20
 
 # Command handlers
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -69,55 +68,60 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     Send a welcome message when the command /start is issued.
     """
     user = update.effective_user
-    await update.message.reply_html(
-        f"Hi {user.mention_html()}! 👋\n\n"
-        f"Welcome to the Memecoin Generator Bot! 🚀\n\n"
-        f"I can help you create your own memecoin on Binance Smart Chain.\n\n"
-        f"Commands:\n"
-        f"/createfree - Create a free untradeable coin\n"
-        f"/unlock - Pay 0.05 BNB to enable trading\n"
-        f"/cmc - Pay 0.5 BNB for CMC listing submission\n"
-        f"/help - Show this help message"
-    )
+    await update.message.reply_html(START_TEMPLATE.format(mention=user.mention_html()))
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Send a help message when the command /help is issued.
     """
-    await update.message.reply_text(
-        "🚀 *Memecoin Generator Bot Help* 🚀\n\n"
-        "*Commands:*\n"
-        "/createfree - Create a free untradeable coin\n"
-        "/unlock - Pay 0.05 BNB to enable trading\n"
-        "/cmc - Pay 0.5 BNB for CMC listing submission\n"
-        "/help - Show this help message\n\n"
-        "*How it works:*\n"
-        "1. Use /createfree to create your coin\n"
-        "2. Follow the steps to set up your tokenomics\n"
-        "3. Upload a logo for your coin\n"
-        "4. Get your contract deployed (trading locked)\n"
-        "5. Use /unlock to enable trading for 0.05 BNB\n"
-        "6. Use /cmc to submit to CoinMarketCap for 0.5 BNB\n\n"
-        "*Note:* All payments are in BNB on the Binance Smart Chain.",
-        parse_mode="Markdown"
-    )
+    await update.message.reply_text(HELP_TEXT, parse_mode="Markdown")
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Log errors caused by updates.
     """
-    logger.error(f"Update {update} caused error {context.error}")
+    logger.error("Update %s caused error %s", update, context.error)
     if update and update.effective_message:
         await update.effective_message.reply_text(
             "❌ An error occurred. Please try again later or contact support."
         )
 
+async def post_init(application: Application) -> None:
+    """
+    Open shared network sessions once the event loop is running and finish
+    any unlocks left pending by a previous run.
+    """
+    await open_rpc_session()
+    application.create_task(reconcile_pending_unlocks())
+
+async def post_shutdown(application: Application) -> None:
+    """
+    Close shared network sessions on shutdown.
+    """
+    await close_rpc_session()
+
 def main() -> None:
     """
     Start the bot.
     """
+    # Persist user data and conversation states across restarts, dropping
+    # creation sessions that went stale while the bot was down
+    persistence = SessionPersistence(filepath=PERSISTENCE_PATH, update_interval=30)
+
     # Create the Application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .persistence(persistence)
+        .concurrent_updates(True)
+        .read_timeout(30)
+        .connect_timeout(10)
+        .pool_timeout(10)
+        .get_updates_read_timeout(POLLING_TIMEOUT + 10)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Setup database
     setup_database()
@@ -135,7 +139,11 @@ def main() -> None:
     application.add_error_handler(error_handler)
 
     # Run the bot until the user presses Ctrl-C
-    application.run_polling()
+    application.run_polling(
+        timeout=POLLING_TIMEOUT,
+        poll_interval=0,
+        allowed_updates=Update.ALL_TYPES
+    )
 
 if __name__ == "__main__":
     main()
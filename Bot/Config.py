@@ -24,12 +24,24 @@ MARKETING_WALLET = os.getenv("MARKETING_WALLET")
 LIQUIDITY_WALLET = os.getenv("LIQUIDITY_WALLET")
 PAYMENT_WALLET = os.getenv("PAYMENT_WALLET")
 
+# PaymentReceiver contract; when set, payments are verified from its event logs
+PAYMENT_RECEIVER = os.getenv("PAYMENT_RECEIVER")
+
+# Simulated CMC submission delay in seconds (for testing; 0 disables it)
+CMC_SIMULATE_DELAY = float(os.getenv("CMC_SIMULATE_DELAY", "0"))
+
 # Deployer private key
 DEPLOYER_PRIVATE_KEY = os.getenv("DEPLOYER_PRIVATE_KEY")
 
 # OpenAI API key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Logging level name (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Persistence file for user data and conversation states
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "bot_state.pkl")
+
 # Pricing in BNB
 UNLOCK_PRICE = 0.05
 CMC_PRICE = 0.5
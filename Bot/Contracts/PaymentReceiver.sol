@@ -0,0 +1,22 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.17;
+
+/**
+ * Forwards bot payments to the payment wallet and logs each one under its
+ * reference, so the bot can look payments up by indexed topic.
+ */
+contract PaymentReceiver {
+    address payable public immutable wallet;
+
+    event PaymentReceived(address indexed payer, bytes32 indexed ref, uint256 amount);
+
+    constructor(address payable _wallet) {
+        wallet = _wallet;
+    }
+
+    function pay(bytes32 ref) external payable {
+        (bool sent, ) = wallet.call{value: msg.value}("");
+        require(sent, "Forwarding payment failed");
+        emit PaymentReceived(msg.sender, ref, msg.value);
+    }
+}
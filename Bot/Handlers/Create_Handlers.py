@@ -5,33 +5,75 @@ Handles the coin creation process and related commands.
 """
 
 import os
+import re
+import hashlib
+import asyncio
 import logging
+import time
+from pathlib import Path
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters, ConversationHandler
-from Bot.Utils.Image_Processor import compress_image
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, TypeHandler, filters, ConversationHandler, PicklePersistence
+from Bot.Config import DEV_WALLET, MARKETING_WALLET, LIQUIDITY_WALLET, DEPLOYER_PRIVATE_KEY
+from Bot.Utils.Image_Processor import compress_image_async, is_valid_image
 from Bot.Utils.BlockChain import deploy_contract
-from Bot.Utils.Database import add_new_coin, get_user_coin
-import random
+from Bot.Utils.Database import add_new_coin, get_user_coin_summary
+import secrets
 import string
 
 # States for conversation handler
 (NAME, SYMBOL, SUPPLY, LOGO, CONFIRM) = range(5)
 
-# User session storage
-user_data = {}
+# Directory processed logos are written to, named by content hash
+LOGO_DIR = "logos"
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+# Largest logo upload accepted, in bytes
+MAX_LOGO_FILE_SIZE = 2 * 1024 * 1024
+
+# Abandoned creation sessions are dropped after this many seconds
+SESSION_TIMEOUT = 1800
+
+# Name of the persisted creation conversation and the user_data key holding
+# the time of the last update in an open session
+CREATE_CONVERSATION = "create"
+SESSION_ACTIVE_KEY = "session_active_at"
+
+# Reference IDs are drawn from a CSPRNG over this alphabet
+REF_ID_ALPHABET = string.ascii_uppercase + string.digits
+REF_ID_LENGTH = 8
+_ref_id_random = secrets.SystemRandom()
+
+# Coin symbols: 2-6 ASCII letters or digits
+SYMBOL_PATTERN = re.compile(r"[A-Za-z0-9]{2,6}")
+
+# Callback data patterns and preset supplies
+SUPPLY_PATTERN = re.compile(r"^supply_")
+CONFIRM_PATTERN = re.compile(r"^confirm_(yes|no)$")
+SUPPLY_PRESETS = {
+    "supply_1000000": 1_000_000,
+    "supply_100000000": 100_000_000,
+    "supply_1000000000": 1_000_000_000,
+}
 
-# Bot configuration from environment
-DEV_WALLET = os.getenv("DEV_WALLET")
-MARKETING_WALLET = os.getenv("MARKETING_WALLET")
-LIQUIDITY_WALLET = os.getenv("LIQUIDITY_WALLET")
-DEPLOYER_PRIVATE_KEY = os.getenv("DEPLOYER_PRIVATE_KEY")
+# Static inline keyboards
+SUPPLY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("1,000,000", callback_data="supply_1000000")],
+    [InlineKeyboardButton("100,000,000", callback_data="supply_100000000")],
+    [InlineKeyboardButton("1,000,000,000", callback_data="supply_1000000000")],
+    [InlineKeyboardButton("Custom Supply", callback_data="supply_custom")]
+])
+CONFIRM_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Yes, deploy my coin!", callback_data="confirm_yes")],
+    [InlineKeyboardButton("❌ No, start over", callback_data="confirm_no")]
+])
+
+# Pending background logo processing tasks by user ID
+_logo_tasks = {}
+
+# Contract deployments allowed to run at once; further ones wait for a slot
+MAX_CONCURRENT_DEPLOYMENTS = 4
+_deploy_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DEPLOYMENTS)
+
+logger = logging.getLogger(__name__)
 
 async def create_free(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
@@ -40,17 +82,19 @@ async def create_free(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     user_id = update.effective_user.id
     
     # Check if user already has a coin
-    existing_coin = get_user_coin(user_id)
+    existing_coin = get_user_coin_summary(user_id)
     if existing_coin:
         await update.message.reply_text(
-            f"⚠️ You already have a coin: {existing_coin['name']} ({existing_coin['symbol']})\n"
-            f"Contract: {existing_coin['contract_address']}\n\n"
+            f"⚠️ You already have a coin: {existing_coin.name} ({existing_coin.symbol})\n"
+            f"Contract: {existing_coin.contract_address}\n\n"
             f"You can only create one coin per Telegram account."
         )
         return ConversationHandler.END
     
     # Initialize user data
-    user_data[user_id] = {}
+    discard_logo_task(user_id)
+    context.user_data.clear()
+    context.user_data[SESSION_ACTIVE_KEY] = time.time()
     
     await update.message.reply_text(
         "🚀 Let's create your memecoin!\n\n"
@@ -64,11 +108,10 @@ async def coin_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Process the coin name and ask for symbol.
     """
-    user_id = update.effective_user.id
     name = update.message.text.strip()
     
     # Validate name
-    if len(name) < 3 or len(name) > 30:
+    if not 3 <= len(name) <= 30:
         await update.message.reply_text(
             "⚠️ Coin name must be between 3 and 30 characters.\n"
             "Please enter a valid name:"
@@ -76,7 +119,7 @@ async def coin_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return NAME
     
     # Store name
-    user_data[user_id]['name'] = name
+    context.user_data['name'] = name
     
     await update.message.reply_text(
         f"Great! Your coin will be named '{name}'.\n\n"
@@ -90,33 +133,26 @@ async def coin_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     """
     Process the coin symbol and ask for supply.
     """
-    user_id = update.effective_user.id
-    symbol = update.message.text.strip().upper()
+    symbol = update.message.text.strip()
     
     # Validate symbol
-    if len(symbol) < 2 or len(symbol) > 6 or not symbol.isalnum():
+    if not SYMBOL_PATTERN.fullmatch(symbol):
         await update.message.reply_text(
             "⚠️ Symbol must be 2-6 alphanumeric characters.\n"
             "Please enter a valid symbol:"
         )
         return SYMBOL
     
+    symbol = symbol.upper()
+    
     # Store symbol
-    user_data[user_id]['symbol'] = symbol
+    context.user_data['symbol'] = symbol
     
     # Ask for total supply with buttons for common options
-    keyboard = [
-        [InlineKeyboardButton("1,000,000", callback_data="supply_1000000")],
-        [InlineKeyboardButton("100,000,000", callback_data="supply_100000000")],
-        [InlineKeyboardButton("1,000,000,000", callback_data="supply_1000000000")],
-        [InlineKeyboardButton("Custom Supply", callback_data="supply_custom")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
-        f"Your coin will be {user_data[user_id]['name']} ({symbol}).\n\n"
+        f"Your coin will be {context.user_data['name']} ({symbol}).\n\n"
         f"Now, what's the total supply for your coin?",
-        reply_markup=reply_markup
+        reply_markup=SUPPLY_KEYBOARD
     )
     
     return SUPPLY
@@ -128,19 +164,16 @@ async def supply_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     query = update.callback_query
     await query.answer()
     
-    user_id = query.from_user.id
-    data = query.data
+    supply = SUPPLY_PRESETS.get(query.data)
     
-    if data == "supply_custom":
+    if supply is None:
         await query.edit_message_text(
             "Please enter your custom supply (number only):\n"
             "Example: 1000000000"
         )
         return SUPPLY
     
-    # Extract supply from callback data
-    supply = int(data.split("_")[1])
-    user_data[user_id]['supply'] = supply
+    context.user_data['supply'] = supply
     
     await query.edit_message_text(
         f"Great! Your coin will have a total supply of {supply:,}.\n\n"
@@ -153,7 +186,6 @@ async def custom_supply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     """
     Process custom supply input.
     """
-    user_id = update.effective_user.id
     text = update.message.text.strip()
     
     try:
@@ -168,7 +200,7 @@ async def custom_supply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return SUPPLY
     
     # Store supply
-    user_data[user_id]['supply'] = supply
+    context.user_data['supply'] = supply
     
     await update.message.reply_text(
         f"Great! Your coin will have a total supply of {supply:,}.\n\n"
@@ -177,6 +209,68 @@ async def custom_supply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     
     return LOGO
 
+def store_logo(compressed_path: str) -> str:
+    """
+    Move a compressed logo into the content-addressed logo store.
+    
+    Logos are stored as LOGO_DIR/<hash[:2]>/<hash>.png, so identical logos
+    are kept once and an existing copy is reused.
+    
+    Returns:
+        The stored logo path
+    """
+    digest = hashlib.sha256(Path(compressed_path).read_bytes()).hexdigest()
+    logo_path = os.path.join(LOGO_DIR, digest[:2], f"{digest}.png")
+    
+    if os.path.exists(logo_path):
+        os.unlink(compressed_path)
+    else:
+        os.makedirs(os.path.dirname(logo_path), exist_ok=True)
+        os.replace(compressed_path, logo_path)
+    
+    return logo_path
+
+async def process_logo(bot, file_id: str, user_id: int):
+    """
+    Download, validate, compress and store an uploaded logo.
+    
+    Returns:
+        The stored logo path, or None if the image was rejected
+    """
+    tmp_path = os.path.join(LOGO_DIR, f"{user_id}.tmp")
+    compressed_path = os.path.join(LOGO_DIR, f"{user_id}.png.tmp")
+    photo_file = await bot.get_file(file_id)
+    
+    try:
+        # Download straight to disk, then compress and store the logo
+        await photo_file.download_to_drive(tmp_path)
+        
+        # Reject unsupported or oversized images before decoding them
+        if not await asyncio.to_thread(is_valid_image, tmp_path):
+            return None
+        
+        await compress_image_async(tmp_path, compressed_path)
+        return await asyncio.to_thread(store_logo, compressed_path)
+    
+    finally:
+        await asyncio.to_thread(Path(tmp_path).unlink, missing_ok=True)
+        await asyncio.to_thread(Path(compressed_path).unlink, missing_ok=True)
+
+def discard_logo_task(user_id: int) -> None:
+    """
+    Cancel a user's pending logo processing task, if any.
+    """
+    task = _logo_tasks.pop(user_id, None)
+    if task is not None:
+        task.cancel()
+
+def _end_session(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Drop a user's pending logo task and session data when their creation session ends.
+    """
+    discard_logo_task(user_id)
+    context.user_data.clear()
+
 async def coin_logo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Process the coin logo upload.
@@ -192,58 +286,42 @@ async def coin_logo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     # Get the largest photo (best quality)
     photo = update.message.photo[-1]
-    photo_file = await context.bot.get_file(photo.file_id)
-    
-    # Download and process the image
-    photo_bytes = await photo_file.download_as_bytearray()
     
-    # Compress and resize the image
-    try:
-        compressed_logo = compress_image(photo_bytes)
-        
-        # Save the logo to user data
-        logo_filename = f"{user_id}_{user_data[user_id]['symbol']}.png"
-        logo_path = os.path.join("logos", logo_filename)
-        
-        # Ensure the logos directory exists
-        os.makedirs("logos", exist_ok=True)
-        
-        # Save the compressed image
-        with open(logo_path, "wb") as f:
-            f.write(compressed_logo)
-        
-        user_data[user_id]['logo_path'] = logo_path
-        
-        # Show confirmation with all details
-        name = user_data[user_id]['name']
-        symbol = user_data[user_id]['symbol']
-        supply = user_data[user_id]['supply']
-        
-        # Send the processed logo back to the user
-        await context.bot.send_photo(
-            chat_id=update.effective_chat.id,
-            photo=compressed_logo,
-            caption=f"✅ Logo processed successfully!\n\n"
-                   f"*Coin Details:*\n"
-                   f"Name: {name}\n"
-                   f"Symbol: {symbol}\n"
-                   f"Supply: {supply:,}\n\n"
-                   f"Is this correct? If yes, I'll deploy your coin!",
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("✅ Yes, deploy my coin!", callback_data="confirm_yes")],
-                [InlineKeyboardButton("❌ No, start over", callback_data="confirm_no")]
-            ])
-        )
-        
-        return CONFIRM
-        
-    except Exception as e:
-        logger.error(f"Error processing image: {e}")
+    # Reject oversized uploads before downloading anything
+    if photo.file_size and photo.file_size > MAX_LOGO_FILE_SIZE:
         await update.message.reply_text(
-            "❌ There was an error processing your image. Please try uploading a different image."
+            "⚠️ Image too large (max 2MB). Please upload a smaller logo."
         )
         return LOGO
+    
+    context.user_data['logo_file_id'] = photo.file_id
+    
+    # Process the logo in the background while the user reviews the details
+    discard_logo_task(user_id)
+    _logo_tasks[user_id] = asyncio.create_task(
+        process_logo(context.bot, photo.file_id, user_id)
+    )
+    
+    # Show confirmation with all details
+    name = context.user_data['name']
+    symbol = context.user_data['symbol']
+    supply = context.user_data['supply']
+    
+    # Echo the uploaded photo back by file_id (no re-upload)
+    await context.bot.send_photo(
+        chat_id=update.effective_chat.id,
+        photo=photo.file_id,
+        caption=f"✅ Logo received!\n\n"
+               f"*Coin Details:*\n"
+               f"Name: {name}\n"
+               f"Symbol: {symbol}\n"
+               f"Supply: {supply:,}\n\n"
+               f"Is this correct? If yes, I'll deploy your coin!",
+        parse_mode="Markdown",
+        reply_markup=CONFIRM_KEYBOARD
+    )
+    
+    return CONFIRM
 
 async def confirm_creation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
@@ -256,16 +334,34 @@ async def confirm_creation(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     data = query.data
     
     if data == "confirm_no":
+        _end_session(user_id, context)
         await query.edit_message_caption(
             caption="🔄 Coin creation cancelled. Use /createfree to start over."
         )
         return ConversationHandler.END
     
     # Get coin details
-    name = user_data[user_id]['name']
-    symbol = user_data[user_id]['symbol']
-    supply = user_data[user_id]['supply']
-    logo_path = user_data[user_id]['logo_path']
+    name = context.user_data['name']
+    symbol = context.user_data['symbol']
+    supply = context.user_data['supply']
+    
+    # Wait for the logo processing started in coin_logo (or redo it after a restart)
+    task = _logo_tasks.pop(user_id, None)
+    try:
+        if task is None:
+            logo_path = await process_logo(context.bot, context.user_data['logo_file_id'], user_id)
+        else:
+            logo_path = await task
+    except Exception:
+        logger.exception("Error processing image")
+        logo_path = None
+    
+    if not logo_path:
+        await query.edit_message_caption(
+            caption="⚠️ Your logo couldn't be processed. Please upload a PNG, JPEG or WEBP "
+                    "logo (max 4096x4096)."
+        )
+        return LOGO
     
     # Show deploying message
     await query.edit_message_caption(
@@ -279,18 +375,19 @@ async def confirm_creation(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     
     try:
         # Generate a random reference ID for this deployment
-        ref_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+        ref_id = ''.join(_ref_id_random.choices(REF_ID_ALPHABET, k=REF_ID_LENGTH))
         
         # Deploy the contract
-        contract_address = await deploy_contract(
-            name=name,
-            symbol=symbol,
-            total_supply=supply,
-            dev_wallet=DEV_WALLET,
-            marketing_wallet=MARKETING_WALLET,
-            liquidity_wallet=LIQUIDITY_WALLET,
-            deployer_key=DEPLOYER_PRIVATE_KEY
-        )
+        async with _deploy_semaphore:
+            contract_address = await deploy_contract(
+                name=name,
+                symbol=symbol,
+                total_supply=supply,
+                dev_wallet=DEV_WALLET,
+                marketing_wallet=MARKETING_WALLET,
+                liquidity_wallet=LIQUIDITY_WALLET,
+                deployer_key=DEPLOYER_PRIVATE_KEY
+            )
         
         if not contract_address:
             raise Exception("Contract deployment failed")
@@ -320,7 +417,7 @@ async def confirm_creation(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         
         await context.bot.send_photo(
             chat_id=update.effective_chat.id,
-            photo=open(logo_path, "rb"),
+            photo=context.user_data['logo_file_id'],
             caption=f"🆓 FREE COIN CREATED!\n\n"
                    f"Name: {name} ({symbol})\n"
                    f"Contract: `{contract_address}`\n"
@@ -333,29 +430,26 @@ async def confirm_creation(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         )
         
         # Clean up user data
-        if user_id in user_data:
-            del user_data[user_id]
+        _end_session(user_id, context)
         
         return ConversationHandler.END
         
     except Exception as e:
-        logger.error(f"Error deploying contract: {e}")
+        logger.error("Error deploying contract: %s", e)
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=f"❌ There was an error deploying your coin: {str(e)}\n"
                  f"Please try again later or contact support."
         )
+        _end_session(user_id, context)
         return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Cancel the conversation.
     """
-    user_id = update.effective_user.id
-    
     # Clean up user data
-    if user_id in user_data:
-        del user_data[user_id]
+    _end_session(update.effective_user.id, context)
     
     await update.message.reply_text(
         "❌ Coin creation cancelled. Use /createfree to start over."
@@ -363,10 +457,67 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     return ConversationHandler.END
 
+async def session_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+    Drop the stored data of an abandoned coin creation session.
+    """
+    user_id = update.effective_user.id
+    discard_logo_task(user_id)
+    context.application.drop_user_data(user_id)
+    
+    logger.info("Creation session for user %s timed out and was dropped", user_id)
+    
+    return ConversationHandler.END
+
+async def touch_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Record activity in a user's open creation session.
+    """
+    user = update.effective_user
+    if user is None:
+        return
+    
+    # Look the user up without creating user_data for users outside a session
+    user_data = context.application.user_data.get(user.id)
+    if user_data and SESSION_ACTIVE_KEY in user_data:
+        user_data[SESSION_ACTIVE_KEY] = time.time()
+
+class SessionPersistence(PicklePersistence):
+    """
+    PicklePersistence that drops creation sessions which went stale while the
+    bot was down. Timeout jobs are not persisted, so a restored session that is
+    never resumed would otherwise stay open and keep its user_data forever.
+    """
+    
+    async def get_user_data(self):
+        # User data is loaded before the conversations are restored, so both
+        # can be cleaned up here
+        conversations = await self.get_conversations(CREATE_CONVERSATION)
+        user_data = await super().get_user_data()
+        now = time.time()
+        
+        for key, state in conversations.items():
+            if state is None:
+                continue
+            
+            # Conversations are per user, so the key is (user_id,)
+            user_id = key[0]
+            active_at = user_data.get(user_id, {}).get(SESSION_ACTIVE_KEY, 0)
+            if now - active_at > SESSION_TIMEOUT:
+                await self.update_conversation(CREATE_CONVERSATION, key, None)
+                await self.drop_user_data(user_id)
+                user_data.pop(user_id, None)
+                logger.info("Dropped creation session of user %s left over from a previous run", user_id)
+        
+        return user_data
+
 def setup_create_handlers(application: Application) -> None:
     """
     Set up all handlers related to coin creation.
     """
+    # Ensure the logos directory exists
+    os.makedirs(LOGO_DIR, exist_ok=True)
+    
     # Create conversation handler for coin creation
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler("createfree", create_free)],
@@ -374,13 +525,23 @@ def setup_create_handlers(application: Application) -> None:
             NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, coin_name)],
             SYMBOL: [MessageHandler(filters.TEXT & ~filters.COMMAND, coin_symbol)],
             SUPPLY: [
-                CallbackQueryHandler(supply_button, pattern=r"^supply_"),
+                CallbackQueryHandler(supply_button, pattern=SUPPLY_PATTERN),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, custom_supply)
             ],
             LOGO: [MessageHandler(filters.PHOTO, coin_logo)],
-            CONFIRM: [CallbackQueryHandler(confirm_creation, pattern=r"^confirm_")]
+            CONFIRM: [CallbackQueryHandler(confirm_creation, pattern=CONFIRM_PATTERN)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, session_timeout)]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        per_chat=False,
+        per_user=True,
+        per_message=False,
+        block=False,
+        conversation_timeout=SESSION_TIMEOUT,
+        persistent=True,
+        name=CREATE_CONVERSATION
     )
     
+    # Stamp session activity before the conversation handles the update
+    application.add_handler(TypeHandler(Update, touch_session), group=-1)
     application.add_handler(conv_handler)
@@ -4,28 +4,98 @@ Payment Handlers Module
 Handles payment processing for premium features like unlocking trading and CMC listing.
 """
 
-import os
+import re
+import asyncio
 import logging
 import time
+from functools import lru_cache
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-from Bot.Utils.BlockChain import unlock_trading, submit_cmc, verify_payment
-from Bot.Utils.Database import get_user_coin, update_coin_status
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from Bot.Config import DEPLOYER_PRIVATE_KEY, PAYMENT_WALLET, PAYMENT_RECEIVER, UNLOCK_PRICE, CMC_PRICE
+from Bot.Utils.BlockChain import unlock_trading, confirm_transaction, submit_cmc, verify_payment, encode_reference
+from Bot.Utils.Database import (
+    get_user_coin, get_user_coin_summary, update_coin_status,
+    add_transaction, update_transaction_status, get_pending_transactions, has_pending_transaction
 )
+
 logger = logging.getLogger(__name__)
 
-# Bot configuration from environment
-DEPLOYER_PRIVATE_KEY = os.getenv("DEPLOYER_PRIVATE_KEY")
-PAYMENT_WALLET = os.getenv("PAYMENT_WALLET")
+# Payment callbacks: <action>_<payment type>_<contract address>
+CALLBACK_PATTERN = re.compile(r"^(ton_pay|verify)_(unlock|cmc)_(\w+)$")
+
+def payment_instructions(title: str, purpose: str, price: float, payment_type: str) -> str:
+    """
+    Build a payment instructions template with the destination and price filled in.
+    
+    The template is formatted with coin= and reference= (the bytes32 reference
+    passed to PaymentReceiver.pay(), only used when PAYMENT_RECEIVER is set).
+    """
+    if PAYMENT_RECEIVER:
+        # Only pay(ref) on the receiver contract emits the event payments are matched by
+        destination = (
+            f"To {purpose}, please send *{price} BNB* by calling `pay(bytes32 ref)` on:\n\n"
+            f"`{PAYMENT_RECEIVER}`\n\n"
+            "*Important:*\n"
+            "- Pass this value as `ref`: `{reference}`\n"
+            "- Plain transfers to the contract or the wallet can't be matched to your coin\n"
+        )
+    else:
+        destination = (
+            f"To {purpose}, please send *{price} BNB* to:\n\n"
+            f"`{PAYMENT_WALLET}`\n\n"
+            "*Important:*\n"
+            f"- Include reference: `{payment_type.upper()}-{{coin.ref_id}}` in transaction memo\n"
+        )
+    
+    return (
+        title
+        + destination
+        + "- Only BNB on Binance Smart Chain (BSC) is accepted\n\n"
+        "After sending the payment, click 'I've Sent the Payment' to verify."
+    )
+
+def payment_reference(payment_type: str, ref_id: str) -> str:
+    """
+    Get the reference a coin's unlock or CMC payment is matched by.
+    """
+    return f"{payment_type.upper()}-{ref_id}"
+
+def encoded_payment_reference(payment_type: str, ref_id: str) -> str:
+    """
+    Get the payment reference as the 0x-prefixed bytes32 passed to PaymentReceiver.pay().
+    """
+    return "0x" + encode_reference(payment_reference(payment_type, ref_id)).hex()
+
+# Payment instructions with the destination and prices filled in at import time
+UNLOCK_INSTRUCTIONS = payment_instructions(
+    "🔓 *Unlock Trading for {coin.name} ({coin.symbol})*\n\n",
+    "enable trading for your coin",
+    UNLOCK_PRICE,
+    "unlock"
+)
+
+CMC_INSTRUCTIONS = payment_instructions(
+    "📊 *CMC Listing for {coin.name} ({coin.symbol})*\n\n",
+    "submit your coin to CoinMarketCap",
+    CMC_PRICE,
+    "cmc"
+)
+
+# Coins whose unlock is being verified or broadcast by this process
+_unlocks_in_progress = set()
 
-# Pricing in BNB
-UNLOCK_PRICE = 0.05
-CMC_PRICE = 0.5
+# Buttons that never change are built once
+HELP_BUTTON = InlineKeyboardButton("❓ Need Help", url="https://t.me/memecoin_support")
+
+@lru_cache(maxsize=1024)
+def payment_keyboard(payment_type: str, contract_address: str) -> InlineKeyboardMarkup:
+    """
+    Build (once per coin) the pay/verify keyboard for an unlock or CMC payment.
+    """
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("💳 Pay with TON Connect", callback_data=f"ton_pay_{payment_type}_{contract_address}")],
+        [InlineKeyboardButton("✅ I've Sent the Payment", callback_data=f"verify_{payment_type}_{contract_address}")]
+    ])
 
 async def unlock_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -34,7 +104,7 @@ async def unlock_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = update.effective_user.id
     
     # Check if user has a coin
-    coin = get_user_coin(user_id)
+    coin = get_user_coin_summary(user_id)
     if not coin:
         await update.message.reply_text(
             "❌ You don't have any coins created yet. Use /createfree to create one first."
@@ -42,36 +112,17 @@ async def unlock_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     # Check if trading is already enabled
-    if coin['trading_enabled']:
+    if coin.trading_enabled:
         await update.message.reply_text(
-            f"✅ Trading is already enabled for your coin {coin['name']} ({coin['symbol']})."
+            f"✅ Trading is already enabled for your coin {coin.name} ({coin.symbol})."
         )
         return
     
-    # Create payment instructions
-    payment_address = PAYMENT_WALLET
-    payment_amount = UNLOCK_PRICE
-    
-    # Create a unique payment reference
-    payment_ref = f"UNLOCK-{coin['ref_id']}"
-    
-    # Create inline keyboard with payment options
-    keyboard = [
-        [InlineKeyboardButton("💳 Pay with TON Connect", callback_data=f"ton_pay_unlock_{coin['contract_address']}")],
-        [InlineKeyboardButton("✅ I've Sent the Payment", callback_data=f"verify_unlock_{coin['contract_address']}")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    # Send payment instructions with a unique payment reference
     await update.message.reply_text(
-        f"🔓 *Unlock Trading for {coin['name']} ({coin['symbol']})*\n\n"
-        f"To enable trading for your coin, please send *{payment_amount} BNB* to:\n\n"
-        f"`{payment_address}`\n\n"
-        f"*Important:*\n"
-        f"- Include reference: `{payment_ref}` in transaction memo\n"
-        f"- Only BNB on Binance Smart Chain (BSC) is accepted\n\n"
-        f"After sending the payment, click 'I've Sent the Payment' to verify.",
+        UNLOCK_INSTRUCTIONS.format(coin=coin, reference=encoded_payment_reference("unlock", coin.ref_id)),
         parse_mode="Markdown",
-        reply_markup=reply_markup
+        reply_markup=payment_keyboard("unlock", coin.contract_address)
     )
 
 async def cmc_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -81,7 +132,7 @@ async def cmc_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     user_id = update.effective_user.id
     
     # Check if user has a coin
-    coin = get_user_coin(user_id)
+    coin = get_user_coin_summary(user_id)
     if not coin:
         await update.message.reply_text(
             "❌ You don't have any coins created yet. Use /createfree to create one first."
@@ -89,7 +140,7 @@ async def cmc_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
     
     # Check if trading is enabled (required for CMC)
-    if not coin['trading_enabled']:
+    if not coin.trading_enabled:
         await update.message.reply_text(
             f"❌ Trading must be enabled before submitting to CMC.\n"
             f"Use /unlock to enable trading for your coin first."
@@ -97,36 +148,17 @@ async def cmc_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
     
     # Check if already submitted to CMC
-    if coin.get('cmc_submitted', False):
+    if coin.cmc_submitted:
         await update.message.reply_text(
-            f"✅ Your coin {coin['name']} ({coin['symbol']}) has already been submitted to CMC."
+            f"✅ Your coin {coin.name} ({coin.symbol}) has already been submitted to CMC."
         )
         return
     
-    # Create payment instructions
-    payment_address = PAYMENT_WALLET
-    payment_amount = CMC_PRICE
-    
-    # Create a unique payment reference
-    payment_ref = f"CMC-{coin['ref_id']}"
-    
-    # Create inline keyboard with payment options
-    keyboard = [
-        [InlineKeyboardButton("💳 Pay with TON Connect", callback_data=f"ton_pay_cmc_{coin['contract_address']}")],
-        [InlineKeyboardButton("✅ I've Sent the Payment", callback_data=f"verify_cmc_{coin['contract_address']}")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    # Send payment instructions with a unique payment reference
     await update.message.reply_text(
-        f"📊 *CMC Listing for {coin['name']} ({coin['symbol']})*\n\n"
-        f"To submit your coin to CoinMarketCap, please send *{payment_amount} BNB* to:\n\n"
-        f"`{payment_address}`\n\n"
-        f"*Important:*\n"
-        f"- Include reference: `{payment_ref}` in transaction memo\n"
-        f"- Only BNB on Binance Smart Chain (BSC) is accepted\n\n"
-        f"After sending the payment, click 'I've Sent the Payment' to verify.",
+        CMC_INSTRUCTIONS.format(coin=coin, reference=encoded_payment_reference("cmc", coin.ref_id)),
         parse_mode="Markdown",
-        reply_markup=reply_markup
+        reply_markup=payment_keyboard("cmc", coin.contract_address)
     )
 
 async def handle_ton_payment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -136,17 +168,14 @@ async def handle_ton_payment(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    data = query.data
     user_id = query.from_user.id
     
-    # Extract payment type and contract address
-    parts = data.split('_')
-    payment_type = parts[2]  # unlock or cmc
-    contract_address = parts[3]
+    # Payment type (unlock or cmc) and contract address from the callback data
+    payment_type, contract_address = context.match.group(2, 3)
     
     # Get coin details
-    coin = get_user_coin(user_id)
-    if not coin or coin['contract_address'] != contract_address:
+    coin = get_user_coin_summary(user_id)
+    if not coin or coin.contract_address != contract_address:
         await query.edit_message_text(
             "❌ Invalid coin or contract address. Please try again."
         )
@@ -156,7 +185,13 @@ async def handle_ton_payment(update: Update, context: ContextTypes.DEFAULT_TYPE)
     payment_amount = UNLOCK_PRICE if payment_type == "unlock" else CMC_PRICE
     
     # Generate TON Connect payment link (simplified for this example)
-    ton_payment_link = f"https://tonconnect.example.com/pay?address={PAYMENT_WALLET}&amount={payment_amount}&memo={payment_type.upper()}-{coin['ref_id']}"
+    if PAYMENT_RECEIVER:
+        # Pay through the receiver contract so the payment can be matched by reference
+        reference = encoded_payment_reference(payment_type, coin.ref_id)
+        ton_payment_link = f"https://tonconnect.example.com/pay?address={PAYMENT_RECEIVER}&amount={payment_amount}&method=pay&ref={reference}"
+    else:
+        reference = payment_reference(payment_type, coin.ref_id)
+        ton_payment_link = f"https://tonconnect.example.com/pay?address={PAYMENT_WALLET}&amount={payment_amount}&memo={reference}"
     
     # Create inline keyboard with payment link
     keyboard = [
@@ -173,6 +208,74 @@ async def handle_ton_payment(update: Update, context: ContextTypes.DEFAULT_TYPE)
         reply_markup=reply_markup
     )
 
+async def finish_unlock(user_id: int, contract_address: str, tx_hash: str) -> bool:
+    """
+    Wait for a recorded unlock transaction and store its outcome.
+    
+    Returns:
+        True if trading was enabled, False otherwise
+    """
+    if not await confirm_transaction(tx_hash):
+        update_transaction_status(tx_hash, "failed")
+        return False
+    
+    # Leave the transaction pending if the coin can't be marked unlocked,
+    # so reconciliation at the next startup retries it
+    if not await update_coin_status(user_id, contract_address, trading_enabled=True):
+        logger.error("Unlock %s confirmed but %s could not be marked unlocked", tx_hash, contract_address)
+        return False
+    
+    update_transaction_status(tx_hash, "confirmed")
+    return True
+
+async def reconcile_pending_unlocks() -> None:
+    """
+    Finish unlock transactions that were still pending when the bot stopped.
+    """
+    pending = get_pending_transactions("unlock")
+    if not pending:
+        return
+    
+    logger.info("Reconciling %d pending unlock transaction(s)", len(pending))
+    results = await asyncio.gather(*(
+        finish_unlock(user_id, contract_address, tx_hash)
+        for user_id, contract_address, tx_hash in pending
+    ))
+    logger.info("Reconciled pending unlocks: %d confirmed, %d failed", sum(results), len(results) - sum(results))
+
+async def confirm_unlock(query, user_id, coin, tx_hash) -> None:
+    """
+    Wait for an unlock transaction and update the user's message with the result.
+    """
+    contract_address = coin.contract_address
+    
+    if not await finish_unlock(user_id, contract_address, tx_hash):
+        await query.edit_message_text(
+            f"❌ The unlock transaction `{tx_hash}` failed or was not confirmed in time.\n\n"
+            f"Your payment has been verified. Please contact support for assistance.",
+            parse_mode="Markdown"
+        )
+        return
+    
+    # Send success message
+    bscscan_url = f"https://bscscan.com/token/{contract_address}"
+    
+    keyboard = [
+        [InlineKeyboardButton("🔍 View on BSCScan", url=bscscan_url)],
+        [InlineKeyboardButton("📊 CMC Listing (0.5 BNB)", callback_data=f"ton_pay_cmc_{contract_address}")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.edit_message_text(
+        f"✅ *Trading Unlocked Successfully!*\n\n"
+        f"Your coin {coin.name} ({coin.symbol}) is now tradeable!\n\n"
+        f"Contract: `{contract_address}`\n\n"
+        f"You can now add liquidity and start trading your coin.\n"
+        f"Consider submitting to CoinMarketCap for more visibility!",
+        parse_mode="Markdown",
+        reply_markup=reply_markup
+    )
+
 async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Verify payment and process the requested action.
@@ -180,22 +283,53 @@ async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    data = query.data
     user_id = query.from_user.id
     
-    # Extract payment type and contract address
-    parts = data.split('_')
-    payment_type = parts[1]  # unlock or cmc
-    contract_address = parts[2]
+    # Payment type (unlock or cmc) and contract address from the callback data
+    payment_type, contract_address = context.match.group(2, 3)
     
     # Get coin details
     coin = get_user_coin(user_id)
-    if not coin or coin['contract_address'] != contract_address:
+    if not coin or coin.contract_address != contract_address:
         await query.edit_message_text(
             "❌ Invalid coin or contract address. Please try again."
         )
         return
     
+    if payment_type != "unlock":
+        await process_payment(update, context, user_id, coin, payment_type)
+        return
+    
+    # A stale button must not redo an unlock that already went through
+    if coin.trading_enabled:
+        await query.edit_message_text(
+            f"✅ Trading is already enabled for {coin.name} ({coin.symbol})."
+        )
+        return
+    
+    # Don't send a second unlock while one is being verified or confirmed.
+    # The coin is reserved before the first await so concurrent clicks can't
+    # both pass this check; once the broadcast is recorded, the pending
+    # transaction row takes over
+    if coin.id in _unlocks_in_progress or has_pending_transaction(coin.id, "unlock"):
+        await query.edit_message_text(
+            "⏳ Your unlock transaction is already being confirmed. Use /mycoin to check its status shortly."
+        )
+        return
+    
+    _unlocks_in_progress.add(coin.id)
+    try:
+        await process_payment(update, context, user_id, coin, payment_type)
+    finally:
+        _unlocks_in_progress.discard(coin.id)
+
+async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, coin, payment_type: str) -> None:
+    """
+    Verify a coin's unlock or CMC payment and carry out the paid action.
+    """
+    query = update.callback_query
+    contract_address = coin.contract_address
+    
     # Show verifying message
     await query.edit_message_text(
         f"⏳ Verifying your payment... This may take a moment."
@@ -203,20 +337,21 @@ async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_
     
     # Determine payment amount and reference
     payment_amount = UNLOCK_PRICE if payment_type == "unlock" else CMC_PRICE
-    payment_ref = f"{payment_type.upper()}-{coin['ref_id']}"
+    payment_ref = payment_reference(payment_type, coin.ref_id)
     
     # Verify payment on blockchain
     payment_verified = await verify_payment(
         wallet_address=PAYMENT_WALLET,
         expected_amount=payment_amount,
-        reference=payment_ref
+        reference=payment_ref,
+        since=coin.created_at
     )
     
     if not payment_verified:
         # Payment not found or insufficient
         keyboard = [
             [InlineKeyboardButton("💳 Try Again", callback_data=f"ton_pay_{payment_type}_{contract_address}")],
-            [InlineKeyboardButton("❓ Need Help", url="https://t.me/memecoin_support")]
+            [HELP_BUTTON]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -225,7 +360,7 @@ async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_
             f"Possible reasons:\n"
             f"- Payment not received yet (blockchain confirmations can take time)\n"
             f"- Incorrect payment amount (expected {payment_amount} BNB)\n"
-            f"- Missing or incorrect reference in transaction memo\n\n"
+            f"- Missing or incorrect payment reference\n\n"
             f"Please try again or contact support if you need assistance.",
             reply_markup=reply_markup
         )
@@ -234,33 +369,25 @@ async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_
     # Payment verified, process the action
     try:
         if payment_type == "unlock":
-            # Enable trading
-            success = await unlock_trading(
+            # Broadcast the unlock and confirm it in the background
+            tx_hash = await unlock_trading(
                 contract_address=contract_address,
                 deployer_key=DEPLOYER_PRIVATE_KEY
             )
             
-            if success:
-                # Update database
-                update_coin_status(user_id, contract_address, trading_enabled=True)
-                
-                # Send success message
-                bscscan_url = f"https://bscscan.com/token/{contract_address}"
-                
-                keyboard = [
-                    [InlineKeyboardButton("🔍 View on BSCScan", url=bscscan_url)],
-                    [InlineKeyboardButton("📊 CMC Listing (0.5 BNB)", callback_data=f"ton_pay_cmc_{contract_address}")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+            if tx_hash:
+                # Record the transaction so a restart can still confirm it
+                add_transaction(user_id, coin.id, "unlock", tx_hash, UNLOCK_PRICE, "pending")
                 
                 await query.edit_message_text(
-                    f"✅ *Trading Unlocked Successfully!*\n\n"
-                    f"Your coin {coin['name']} ({coin['symbol']}) is now tradeable!\n\n"
-                    f"Contract: `{contract_address}`\n\n"
-                    f"You can now add liquidity and start trading your coin.\n"
-                    f"Consider submitting to CoinMarketCap for more visibility!",
-                    parse_mode="Markdown",
-                    reply_markup=reply_markup
+                    f"⏳ *Unlocking Trading...*\n\n"
+                    f"Transaction `{tx_hash}` has been broadcast.\n"
+                    f"This message will update once it is confirmed.",
+                    parse_mode="Markdown"
+                )
+                context.application.create_task(
+                    confirm_unlock(query, user_id, coin, tx_hash),
+                    update=update
                 )
             else:
                 raise Exception("Failed to enable trading")
@@ -268,20 +395,20 @@ async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_
         elif payment_type == "cmc":
             # Submit to CMC
             success = await submit_cmc(
-                name=coin['name'],
-                symbol=coin['symbol'],
+                name=coin.name,
+                symbol=coin.symbol,
                 contract_address=contract_address,
-                logo_path=coin['logo_path']
+                logo_path=coin.logo_path
             )
             
             if success:
                 # Update database
-                update_coin_status(user_id, contract_address, cmc_submitted=True)
+                await update_coin_status(user_id, contract_address, cmc_submitted=True)
                 
                 # Send success message
                 await query.edit_message_text(
                     f"✅ *CMC Listing Submission Successful!*\n\n"
-                    f"Your coin {coin['name']} ({coin['symbol']}) has been submitted to CoinMarketCap!\n\n"
+                    f"Your coin {coin.name} ({coin.symbol}) has been submitted to CoinMarketCap!\n\n"
                     f"The CMC team will review your submission, which typically takes 5-7 business days.\n\n"
                     f"You'll receive an email notification when your coin is listed.\n\n"
                     f"Thank you for using our service!",
@@ -291,7 +418,7 @@ async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_
                 raise Exception("Failed to submit to CMC")
                 
     except Exception as e:
-        logger.error(f"Error processing {payment_type} for {contract_address}: {e}")
+        logger.error("Error processing %s for %s: %s", payment_type, contract_address, e)
         
         await query.edit_message_text(
             f"❌ Error processing your request: {str(e)}\n\n"
@@ -299,14 +426,24 @@ async def verify_payment_callback(update: Update, context: ContextTypes.DEFAULT_
             f"Please contact support for assistance."
         )
 
+CALLBACK_HANDLERS = {
+    "ton_pay": handle_ton_payment,
+    "verify": verify_payment_callback,
+}
+
+async def payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Route a payment callback to its handler by the action prefix.
+    """
+    await CALLBACK_HANDLERS[context.match.group(1)](update, context)
+
 def setup_payment_handlers(application: Application) -> None:
     """
     Set up all handlers related to payments.
     """
     # Add command handlers
-    application.add_handler(CommandHandler("unlock", unlock_command))
-    application.add_handler(CommandHandler("cmc", cmc_command))
+    application.add_handler(CommandHandler("unlock", unlock_command, block=False))
+    application.add_handler(CommandHandler("cmc", cmc_command, block=False))
     
     # Add callback query handlers
-    application.add_handler(CallbackQueryHandler(handle_ton_payment, pattern=r"^ton_pay_"))
-    application.add_handler(CallbackQueryHandler(verify_payment_callback, pattern=r"^verify_"))
+    application.add_handler(CallbackQueryHandler(payment_callback, pattern=CALLBACK_PATTERN, block=False))
@@ -4,26 +4,110 @@ Utility Handlers Module
 Handles utility commands and functions for the bot.
 """
 
-import os
+import re
+import asyncio
 import logging
+from functools import lru_cache
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-from Bot.Utils.Database import get_user_coin
-import openai
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from Bot.Config import OPENAI_API_KEY
+from Bot.Utils.Database import get_user_coin_summary, get_cached_shill, save_shill
+from openai import AsyncOpenAI
+
 logger = logging.getLogger(__name__)
 
-# OpenAI API key for shill message generation
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Utility callbacks: <action>[_<contract address>]
+CALLBACK_PATTERN = re.compile(r"^(copy_shill|generate_shill|my_coin)(?:_(\w+))?$")
 
 # Initialize OpenAI client if API key is available
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+
+# Limits for OpenAI requests
+OPENAI_TIMEOUT = 15
+MAX_CONCURRENT_OPENAI_REQUESTS = 10
+_openai_semaphore = asyncio.BoundedSemaphore(MAX_CONCURRENT_OPENAI_REQUESTS)
+
+# Buttons that never change are built once
+BACK_TO_COIN_BUTTON = InlineKeyboardButton("🔙 Back to Coin Info", callback_data="my_coin")
+
+@lru_cache(maxsize=8192)
+def copy_shill_button(contract_address: str) -> InlineKeyboardButton:
+    """
+    Build (once per coin) the button copying a coin's shill message.
+    """
+    return InlineKeyboardButton("📋 Copy Message", callback_data=f"copy_shill_{contract_address}")
+
+@lru_cache(maxsize=8192)
+def coin_keyboard(contract_address: str, trading_enabled: bool, cmc_submitted: bool) -> InlineKeyboardMarkup:
+    """
+    Build (once per coin and status) the /mycoin keyboard.
+    """
+    keyboard = []
+    
+    # Add BSCScan button
+    bscscan_url = f"https://bscscan.com/token/{contract_address}"
+    keyboard.append([InlineKeyboardButton("🔍 View on BSCScan", url=bscscan_url)])
+    
+    # Add unlock trading button if not enabled
+    if not trading_enabled:
+        keyboard.append([InlineKeyboardButton("🔓 Unlock Trading (0.05 BNB)", callback_data=f"ton_pay_unlock_{contract_address}")])
+    
+    # Add CMC button if trading enabled but not submitted
+    elif not cmc_submitted:
+        keyboard.append([InlineKeyboardButton("📊 CMC Listing (0.5 BNB)", callback_data=f"ton_pay_cmc_{contract_address}")])
+    
+    # Add shill generator button
+    keyboard.append([InlineKeyboardButton("📣 Generate Shill Message", callback_data=f"generate_shill_{contract_address}")])
+    
+    return InlineKeyboardMarkup(keyboard)
+
+# Generated shill messages are reused for this many seconds
+SHILL_CACHE_TTL = 24 * 60 * 60
+
+SHILL_PROMPT = """Generate an enthusiastic and engaging cryptocurrency shill message for a new memecoin with the following details:
+    
+    Name: {name}
+    Symbol: {symbol}
+    Contract Address: {contract_address}
+    
+    The message should be attention-grabbing, mention the potential for growth, and encourage people to buy and hold.
+    Include some rocket emojis 🚀 and other relevant emojis.
+    Keep it under 500 characters and make it sound exciting but not scammy.
+    """
+
+@lru_cache(maxsize=2048)
+def shill_prompt(name: str, symbol: str, contract_address: str) -> str:
+    """
+    Build the shill message prompt for a coin.
+    """
+    return SHILL_PROMPT.format(name=name, symbol=symbol, contract_address=contract_address)
+
+async def get_shill_message(coin) -> str:
+    """
+    Get a shill message for a coin, generating one with GPT-3.5 if none is cached.
+    """
+    contract_address = coin.contract_address
+    
+    cached = get_cached_shill(contract_address, SHILL_CACHE_TTL)
+    if cached:
+        return cached
+    
+    # Generate shill message using GPT-3.5
+    async with _openai_semaphore:
+        response = await asyncio.wait_for(
+            openai_client.completions.create(
+                model="gpt-3.5-turbo-instruct",
+                prompt=shill_prompt(coin.name, coin.symbol, contract_address),
+                max_tokens=500,
+                temperature=0.7
+            ),
+            timeout=OPENAI_TIMEOUT
+        )
+    
+    shill_message = response.choices[0].text.strip()
+    save_shill(contract_address, shill_message)
+    
+    return shill_message
 
 async def generate_shill(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -32,7 +116,7 @@ async def generate_shill(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = update.effective_user.id
     
     # Check if user has a coin
-    coin = get_user_coin(user_id)
+    coin = get_user_coin_summary(user_id)
     if not coin:
         await update.message.reply_text(
             "❌ You don't have any coins created yet. Use /createfree to create one first."
@@ -52,32 +136,10 @@ async def generate_shill(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "⏳ Generating your shill message... This may take a moment."
         )
         
-        # Generate shill message using GPT-3.5
-        prompt = f"""Generate an enthusiastic and engaging cryptocurrency shill message for a new memecoin with the following details:
-        
-        Name: {coin['name']}
-        Symbol: {coin['symbol']}
-        Contract Address: {coin['contract_address']}
-        
-        The message should be attention-grabbing, mention the potential for growth, and encourage people to buy and hold.
-        Include some rocket emojis 🚀 and other relevant emojis.
-        Keep it under 500 characters and make it sound exciting but not scammy.
-        """
-        
-        response = openai.Completion.create(
-            engine="text-davinci-003",
-            prompt=prompt,
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        shill_message = response.choices[0].text.strip()
+        shill_message = await get_shill_message(coin)
         
         # Create copy button
-        keyboard = [
-            [InlineKeyboardButton("📋 Copy Message", callback_data=f"copy_shill_{coin['contract_address']}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = InlineKeyboardMarkup([[copy_shill_button(coin.contract_address)]])
         
         # Send the generated shill message
         await message.edit_text(
@@ -88,7 +150,7 @@ async def generate_shill(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         
     except Exception as e:
-        logger.error(f"Error generating shill message: {e}")
+        logger.error("Error generating shill message: %s", e)
         await update.message.reply_text(
             "❌ There was an error generating your shill message. Please try again later."
         )
@@ -110,7 +172,7 @@ async def my_coin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     
     # Check if user has a coin
-    coin = get_user_coin(user_id)
+    coin = get_user_coin_summary(user_id)
     if not coin:
         await update.message.reply_text(
             "❌ You don't have any coins created yet. Use /createfree to create one first."
@@ -118,35 +180,18 @@ async def my_coin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     # Create inline keyboard with options
-    keyboard = []
-    
-    # Add BSCScan button
-    bscscan_url = f"https://bscscan.com/token/{coin['contract_address']}"
-    keyboard.append([InlineKeyboardButton("🔍 View on BSCScan", url=bscscan_url)])
-    
-    # Add unlock trading button if not enabled
-    if not coin['trading_enabled']:
-        keyboard.append([InlineKeyboardButton("🔓 Unlock Trading (0.05 BNB)", callback_data=f"ton_pay_unlock_{coin['contract_address']}")])
-    
-    # Add CMC button if trading enabled but not submitted
-    if coin['trading_enabled'] and not coin.get('cmc_submitted', False):
-        keyboard.append([InlineKeyboardButton("📊 CMC Listing (0.5 BNB)", callback_data=f"ton_pay_cmc_{coin['contract_address']}")])
-    
-    # Add shill generator button
-    keyboard.append([InlineKeyboardButton("📣 Generate Shill Message", callback_data=f"generate_shill_{coin['contract_address']}")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = coin_keyboard(coin.contract_address, bool(coin.trading_enabled), bool(coin.cmc_submitted))
     
     # Send coin information
-    trading_status = "✅ ENABLED" if coin['trading_enabled'] else "❌ LOCKED"
-    cmc_status = "✅ SUBMITTED" if coin.get('cmc_submitted', False) else "❌ NOT SUBMITTED"
+    trading_status = "✅ ENABLED" if coin.trading_enabled else "❌ LOCKED"
+    cmc_status = "✅ SUBMITTED" if coin.cmc_submitted else "❌ NOT SUBMITTED"
     
     await update.message.reply_text(
         f"🪙 *Your Coin Information*\n\n"
-        f"Name: {coin['name']}\n"
-        f"Symbol: {coin['symbol']}\n"
-        f"Contract: `{coin['contract_address']}`\n"
-        f"Reference ID: {coin['ref_id']}\n\n"
+        f"Name: {coin.name}\n"
+        f"Symbol: {coin.symbol}\n"
+        f"Contract: `{coin.contract_address}`\n"
+        f"Reference ID: {coin.ref_id}\n\n"
         f"Trading: {trading_status}\n"
         f"CMC Listing: {cmc_status}\n\n"
         f"Use the buttons below to manage your coin:",
@@ -161,15 +206,14 @@ async def handle_generate_shill(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    # Extract contract address
-    parts = query.data.split('_')
-    contract_address = parts[2]
+    # Contract address from the callback data
+    contract_address = context.match.group(2)
     
     user_id = query.from_user.id
     
     # Check if user has a coin
-    coin = get_user_coin(user_id)
-    if not coin or coin['contract_address'] != contract_address:
+    coin = get_user_coin_summary(user_id)
+    if not coin or coin.contract_address != contract_address:
         await query.edit_message_text(
             "❌ Invalid coin or contract address. Please try again."
         )
@@ -188,33 +232,13 @@ async def handle_generate_shill(update: Update, context: ContextTypes.DEFAULT_TY
             "⏳ Generating your shill message... This may take a moment."
         )
         
-        # Generate shill message using GPT-3.5
-        prompt = f"""Generate an enthusiastic and engaging cryptocurrency shill message for a new memecoin with the following details:
-        
-        Name: {coin['name']}
-        Symbol: {coin['symbol']}
-        Contract Address: {coin['contract_address']}
-        
-        The message should be attention-grabbing, mention the potential for growth, and encourage people to buy and hold.
-        Include some rocket emojis 🚀 and other relevant emojis.
-        Keep it under 500 characters and make it sound exciting but not scammy.
-        """
-        
-        response = openai.Completion.create(
-            engine="text-davinci-003",
-            prompt=prompt,
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        shill_message = response.choices[0].text.strip()
+        shill_message = await get_shill_message(coin)
         
         # Create copy button
-        keyboard = [
-            [InlineKeyboardButton("📋 Copy Message", callback_data=f"copy_shill_{coin['contract_address']}")],
-            [InlineKeyboardButton("🔙 Back to Coin Info", callback_data=f"my_coin")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = InlineKeyboardMarkup([
+            [copy_shill_button(coin.contract_address)],
+            [BACK_TO_COIN_BUTTON]
+        ])
         
         # Send the generated shill message
         await query.edit_message_text(
@@ -225,20 +249,30 @@ async def handle_generate_shill(update: Update, context: ContextTypes.DEFAULT_TY
         )
         
     except Exception as e:
-        logger.error(f"Error generating shill message: {e}")
+        logger.error("Error generating shill message: %s", e)
         await query.edit_message_text(
             "❌ There was an error generating your shill message. Please try again later."
         )
 
+CALLBACK_HANDLERS = {
+    "copy_shill": copy_shill,
+    "generate_shill": handle_generate_shill,
+    "my_coin": my_coin,
+}
+
+async def utility_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Route a utility callback to its handler by the action prefix.
+    """
+    await CALLBACK_HANDLERS[context.match.group(1)](update, context)
+
 def setup_utility_handlers(application: Application) -> None:
     """
     Set up all utility handlers.
     """
     # Add command handlers
-    application.add_handler(CommandHandler("shill", generate_shill))
-    application.add_handler(CommandHandler("mycoin", my_coin))
+    application.add_handler(CommandHandler("shill", generate_shill, block=False))
+    application.add_handler(CommandHandler("mycoin", my_coin, block=False))
     
     # Add callback query handlers
-    application.add_handler(CallbackQueryHandler(copy_shill, pattern=r"^copy_shill_"))
-    application.add_handler(CallbackQueryHandler(handle_generate_shill, pattern=r"^generate_shill_"))
-    application.add_handler(CallbackQueryHandler(my_coin, pattern=r"^my_coin$"))
+    application.add_handler(CallbackQueryHandler(utility_callback, pattern=CALLBACK_PATTERN, block=False))
@@ -7,40 +7,53 @@ Handles blockchain interactions for contract deployment and management.
 import os
 import json
 import logging
+import time
 import asyncio
 import traceback
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
-import requests
-from datetime import datetime, timedelta
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+from collections import OrderedDict
+from functools import lru_cache
+import aiohttp
+import orjson
+from web3 import AsyncWeb3, AsyncHTTPProvider
+from web3.middleware import async_geth_poa_middleware
+from Bot.Config import BSC_RPC_URL, BSC_API_KEY, PAYMENT_RECEIVER, CMC_SIMULATE_DELAY
+from Bot.Utils.Database import get_payment_scan_block, save_payment_scan_block, delete_payment_scan
 
-# Load environment variables
-BSC_RPC_URL = os.getenv("BSC_RPC_URL", "https://bsc-dataseed.binance.org/")
-BSC_API_KEY = os.getenv("BSC_API_KEY")
-DEV_WALLET = os.getenv("DEV_WALLET")
-MARKETING_WALLET = os.getenv("MARKETING_WALLET")
-LIQUIDITY_WALLET = os.getenv("LIQUIDITY_WALLET")
-PAYMENT_WALLET = os.getenv("PAYMENT_WALLET")
+logger = logging.getLogger(__name__)
 
 if not BSC_API_KEY:
     logger.warning("BSC_API_KEY not set. BSCScan features may not work.")
 
+# HTTP connection pool limits for the shared RPC session
+RPC_TIMEOUT = 30
+RPC_CONNECTION_LIMIT = 64
+RPC_CONNECTION_LIMIT_PER_HOST = 32
+RPC_KEEPALIVE_TIMEOUT = 60
+RPC_DNS_CACHE_TTL = 300
+
 # Initialize Web3
-w3 = Web3(Web3.HTTPProvider(BSC_RPC_URL))
-w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+w3 = AsyncWeb3(AsyncHTTPProvider(BSC_RPC_URL, request_kwargs={"timeout": RPC_TIMEOUT}))
+w3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+
+# Keep-alive session shared by the provider, batched RPC calls and BSCScan
+_session = None
+
+# Load contract ABI and bytecode safely, preferring the stripped artifact
+# (just abi and bytecode) written by Scripts/Deploy.sh over the full one
+# unless the full one was recompiled after it
+CONTRACTS_DIR = os.path.join(os.path.dirname(__file__), '../../Bot/Contracts')
+contract_json_path = os.path.join(CONTRACTS_DIR, 'MemeCoin.json')
+min_contract_json_path = os.path.join(CONTRACTS_DIR, 'MemeCoin.min.json')
+try:
+    if os.path.getmtime(min_contract_json_path) >= os.path.getmtime(contract_json_path):
+        contract_json_path = min_contract_json_path
+except FileNotFoundError:
+    if os.path.exists(min_contract_json_path):
+        contract_json_path = min_contract_json_path
 
-# Load contract ABI and bytecode safely
 try:
-    contract_json_path = os.path.join(os.path.dirname(__file__), '../../Bot/Contracts/MemeCoin.json')
-    with open(contract_json_path, 'r') as f:
-        contract_data = json.load(f)
+    with open(contract_json_path, 'rb') as f:
+        contract_data = orjson.loads(f.read())
         CONTRACT_ABI = contract_data['abi']
         CONTRACT_BYTECODE = contract_data['bytecode']
 except FileNotFoundError:
@@ -48,26 +61,293 @@ except FileNotFoundError:
     CONTRACT_ABI = None
     CONTRACT_BYTECODE = None
 except json.JSONDecodeError as e:
-    logger.error(f"Failed to decode MemeCoin.json: {e}")
+    logger.error("Failed to decode MemeCoin.json: %s", e)
     CONTRACT_ABI = None
     CONTRACT_BYTECODE = None
 
+# Contract factory built once; calls only bind an address to it
+_CONTRACT_FACTORY = (
+    w3.eth.contract(abi=CONTRACT_ABI, bytecode=CONTRACT_BYTECODE)
+    if CONTRACT_ABI is not None and CONTRACT_BYTECODE is not None
+    else None
+)
+
+# BSCScan API settings
+BSCSCAN_API_URL = "https://api.bscscan.com/api"
+BSCSCAN_TIMEOUT = 10
+BSCSCAN_PAGE_SIZE = 50
+# Payments older than this are not accepted by the BSCScan scan
+PAYMENT_MAX_AGE = 3600
+
+# The block an hour back is looked up by timestamp and shared for a minute;
+# the block count is only a fallback, padded well past an hour of blocks
+# since block times keep shrinking (the timestamp cutoff still applies)
+BLOCK_BY_TIME_CACHE_TTL = 60
+BSCSCAN_FALLBACK_LOOKBACK_BLOCKS = 10000
+_lookback_block = None  # (fetched_at, block number)
+
+# txlist query parameters that are the same for every request
+BSCSCAN_TXLIST_PARAMS = {
+    "module": "account",
+    "action": "txlist",
+    "endblock": 99999999,
+    "offset": BSCSCAN_PAGE_SIZE,
+    "sort": "desc",
+    "apikey": BSC_API_KEY or ""
+}
+
+# txlist pages are shared by all checks against a wallet for a few seconds
+TXLIST_CACHE_TTL = 10
+_txlist_cache = {}  # (wallet, page) -> (fetched_at, start_block, transactions)
+_txlist_locks = {}  # wallet -> lock, so one fetch serves concurrent checks
+
+# BSCScan free tier allows 5 calls per second
+BSCSCAN_MAX_CONCURRENT = 5
+BSCSCAN_RATE_LIMIT = 5
+_bscscan_semaphore = asyncio.BoundedSemaphore(BSCSCAN_MAX_CONCURRENT)
+_bscscan_rate_lock = asyncio.Lock()
+_bscscan_tokens = BSCSCAN_RATE_LIMIT
+_bscscan_refilled_at = float("-inf")
+
+# PaymentReceiver event lookups (see Contracts/PaymentReceiver.sol)
+PAYMENT_EVENT_TOPIC = AsyncWeb3.to_hex(AsyncWeb3.keccak(text="PaymentReceived(address,bytes32,uint256)"))
+PAYMENT_LOGS_CHUNK_BLOCKS = 5000  # Largest eth_getLogs range most public RPCs accept
+PAYMENT_CLOCK_MARGIN = 300  # Seconds scanned before the coin's creation time
+
+# Payment verification cache: (wallet, reference, wei) -> (checked_at, verified, last_block)
+VERIFY_CACHE_TTL = 20
+VERIFY_CACHE_SIZE = 4096
+_verify_cache = OrderedDict()
+
+# Receipt polling settings
+RECEIPT_TIMEOUT = 120
+RECEIPT_POLL_INTERVAL = 2
+
+# Next nonce per deployer address, tracked locally and re-synced with the
+# node's pending count every NONCE_RESYNC_INTERVAL seconds
+NONCE_RESYNC_INTERVAL = 60
+_nonces = {}
+_nonce_synced_at = {}
+_nonce_lock = asyncio.Lock()
+
+# Sender of each broadcast transaction not yet confirmed, by hash
+_tx_senders = {}
+
+# Gas price is shared by all transactions and reused for about one BSC block
+GAS_PRICE_TTL = 3
+DEFAULT_GAS_PRICE = AsyncWeb3.to_wei(5, "gwei")  # Used if the node reports 0
+_gas_price = None
+_gas_price_at = float("-inf")
+
+# Chain ID never changes for a given RPC endpoint
+_chain_id = None
+
+
+@lru_cache(maxsize=4096)
+def _coin_contract(contract_address):
+    """
+    Get the contract object for a deployed coin.
+    
+    Pass a checksum address so each contract has a single cache entry.
+    """
+    return _CONTRACT_FACTORY(address=contract_address)
+
+
+@lru_cache(maxsize=8)
+def _deployer_account(deployer_key):
+    """
+    Get the signing account for a deployer key, deriving it only once.
+    """
+    return w3.eth.account.from_key(deployer_key)
+
+
+@lru_cache(maxsize=16)
+def _to_wei(amount):
+    """
+    Convert a BNB amount to wei; the prices are constants, so this is memoized.
+    """
+    return AsyncWeb3.to_wei(amount, "ether")
+
+
+async def open_rpc_session():
+    """
+    Open the shared aiohttp session and hand it to the Web3 provider.
+    
+    Called from the bot's startup hook; batched RPC and BSCScan calls also
+    open it on first use.
+    """
+    global _session
+    
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=RPC_CONNECTION_LIMIT,
+            limit_per_host=RPC_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=RPC_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=RPC_DNS_CACHE_TTL
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=RPC_TIMEOUT)
+        )
+        await w3.provider.cache_async_session(_session)
+
+
+async def _get_session():
+    """
+    Get the shared session, opening it first if the bot's startup hook has not.
+    """
+    if _session is None or _session.closed:
+        await open_rpc_session()
+    return _session
+
+
+async def close_rpc_session():
+    """
+    Close the shared aiohttp session.
+    """
+    global _session
+    
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def _rpc_batch(calls):
+    """
+    Send several JSON-RPC calls to the node in a single HTTP request.
+    
+    Args:
+        calls: A list of (method, params) tuples
+        
+    Returns:
+        The results in the same order as the calls
+    """
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    session = await _get_session()
+    async with session.post(
+        BSC_RPC_URL,
+        data=orjson.dumps(payload),
+        headers={"Content-Type": "application/json"}
+    ) as response:
+        response.raise_for_status()
+        data = orjson.loads(await response.read())
+    
+    results = [None] * len(calls)
+    for item in data:
+        if "error" in item:
+            raise RuntimeError(f"RPC error: {item['error']}")
+        results[item["id"]] = item["result"]
+    return results
+
+
+async def _get_tx_params(address):
+    """
+    Get the next nonce, gas price and chain ID for a transaction from address.
+    
+    The nonce is fetched from the node (including pending transactions) and
+    then incremented locally; every NONCE_RESYNC_INTERVAL seconds it is
+    reconciled with the node, never moving backwards. The chain ID is fetched
+    once, and the gas price is reused for GAS_PRICE_TTL seconds. Whatever is
+    missing is requested in one batch.
+    
+    Returns:
+        A (nonce, gas_price, chain_id) tuple
+    """
+    global _gas_price, _gas_price_at, _chain_id
+    
+    async with _nonce_lock:
+        calls = []
+        now = asyncio.get_running_loop().time()
+        need_nonce = now - _nonce_synced_at.get(address, float("-inf")) >= NONCE_RESYNC_INTERVAL
+        need_gas_price = now - _gas_price_at >= GAS_PRICE_TTL
+        need_chain_id = _chain_id is None
+        
+        if need_nonce:
+            calls.append(("eth_getTransactionCount", [address, "pending"]))
+        if need_gas_price:
+            calls.append(("eth_gasPrice", []))
+        if need_chain_id:
+            calls.append(("eth_chainId", []))
+        
+        results = iter(await _rpc_batch(calls) if calls else ())
+        if need_nonce:
+            _nonces[address] = max(int(next(results), 16), _nonces.get(address, 0))
+            _nonce_synced_at[address] = now
+        if need_gas_price:
+            _gas_price = int(next(results), 16) or DEFAULT_GAS_PRICE
+            _gas_price_at = now
+        if need_chain_id:
+            _chain_id = int(next(results), 16)
+        
+        nonce = _nonces[address]
+        _nonces[address] = nonce + 1
+    
+    return nonce, _gas_price, _chain_id
+
+
+def _reset_nonce(address):
+    """
+    Forget the locally tracked nonce for address so the next call re-reads it from the node.
+    """
+    _nonces.pop(address, None)
+    _nonce_synced_at.pop(address, None)
+
+
+def _tx_hash_hex(tx_hash):
+    """
+    Normalise a transaction hash (HexBytes or hex string) to lowercase 0x-prefixed hex.
+    """
+    if isinstance(tx_hash, str):
+        return "0x" + tx_hash.lower().removeprefix("0x")
+    return "0x" + bytes(tx_hash).hex()
+
+
+async def _wait_for_receipts(tx_hashes, timeout=RECEIPT_TIMEOUT):
+    """
+    Wait for several transactions to be mined.
+    
+    All outstanding hashes are polled together in one batched request.
+    
+    Returns:
+        A dict mapping each transaction hash to its raw receipt
+    """
+    pending = [_tx_hash_hex(tx_hash) for tx_hash in tx_hashes]
+    receipts = {}
+    deadline = asyncio.get_running_loop().time() + timeout
+    
+    while pending:
+        results = await _rpc_batch([("eth_getTransactionReceipt", [h]) for h in pending])
+        for tx_hash, receipt in zip(pending, results):
+            if receipt is not None:
+                receipts[tx_hash] = receipt
+        pending = [h for h in pending if h not in receipts]
+        
+        if not pending:
+            break
+        if asyncio.get_running_loop().time() >= deadline:
+            raise TimeoutError(f"Transactions not mined after {timeout}s: {pending}")
+        await asyncio.sleep(RECEIPT_POLL_INTERVAL)
+    
+    return receipts
+
 
 async def deploy_contract(name, symbol, total_supply, dev_wallet, marketing_wallet, liquidity_wallet, deployer_key):
     """
     Deploy a new memecoin contract.
     """
+    deployer_address = None
     try:
-        if CONTRACT_ABI is None or CONTRACT_BYTECODE is None:
+        if _CONTRACT_FACTORY is None:
             raise RuntimeError("Contract ABI or Bytecode not loaded properly.")
 
-        contract = w3.eth.contract(abi=CONTRACT_ABI, bytecode=CONTRACT_BYTECODE)
-        account = w3.eth.account.from_key(deployer_key)
+        account = _deployer_account(deployer_key)
         deployer_address = account.address
-        nonce = w3.eth.get_transaction_count(deployer_address)
-        gas_price = w3.eth.gas_price or w3.to_wei("5", "gwei")
+        nonce, gas_price, chain_id = await _get_tx_params(deployer_address)
 
-        constructor_txn = contract.constructor(
+        constructor_txn = await _CONTRACT_FACTORY.constructor(
             name,
             symbol,
             total_supply,
@@ -78,52 +358,95 @@ async def deploy_contract(name, symbol, total_supply, dev_wallet, marketing_wall
             'from': deployer_address,
             'nonce': nonce,
             'gas': 5000000,
-            'gasPrice': gas_price
+            'gasPrice': gas_price,
+            'chainId': chain_id
         })
 
-        signed_txn = w3.eth.account.sign_transaction(constructor_txn, private_key=deployer_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
-        contract_address = tx_receipt.contractAddress
+        signed_txn = account.sign_transaction(constructor_txn)
+        tx_hash = await w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        
+        receipts = await _wait_for_receipts([tx_hash])
+        contract_address = AsyncWeb3.to_checksum_address(receipts[_tx_hash_hex(tx_hash)]["contractAddress"])
 
-        logger.info(f"Contract deployed at {contract_address}")
+        logger.info("Contract deployed at %s", contract_address)
         return contract_address
 
     except Exception:
+        _reset_nonce(deployer_address)
         logger.error("Error deploying contract:\n%s", traceback.format_exc())
         return None
 
 
 async def unlock_trading(contract_address, deployer_key):
     """
-    Enable trading for a deployed contract.
+    Broadcast the transaction enabling trading for a deployed contract.
+    
+    This does not wait for the transaction to be mined; pass the returned
+    hash to confirm_transaction() for that.
+    
+    Returns:
+        The transaction hash, or None if it could not be sent
     """
+    deployer_address = None
     try:
-        if CONTRACT_ABI is None:
+        if _CONTRACT_FACTORY is None:
             raise RuntimeError("Contract ABI not loaded.")
 
-        contract = w3.eth.contract(address=contract_address, abi=CONTRACT_ABI)
-        account = w3.eth.account.from_key(deployer_key)
+        contract = _coin_contract(AsyncWeb3.to_checksum_address(contract_address))
+        account = _deployer_account(deployer_key)
         deployer_address = account.address
-        nonce = w3.eth.get_transaction_count(deployer_address)
-        gas_price = w3.eth.gas_price or w3.to_wei("5", "gwei")
+        nonce, gas_price, chain_id = await _get_tx_params(deployer_address)
 
-        txn = contract.functions.enableTrading().build_transaction({
+        txn = await contract.functions.enableTrading().build_transaction({
             'from': deployer_address,
             'nonce': nonce,
             'gas': 200000,
-            'gasPrice': gas_price
+            'gasPrice': gas_price,
+            'chainId': chain_id
         })
 
-        signed_txn = w3.eth.account.sign_transaction(txn, private_key=deployer_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+        signed_txn = account.sign_transaction(txn)
+        tx_hash = _tx_hash_hex(await w3.eth.send_raw_transaction(signed_txn.rawTransaction))
+        _tx_senders[tx_hash] = deployer_address
 
-        logger.info(f"Trading enabled for {contract_address}")
-        return True
+        logger.info("Enable trading for %s sent in %s", contract_address, tx_hash)
+        return tx_hash
 
     except Exception:
+        _reset_nonce(deployer_address)
         logger.error("Error enabling trading:\n%s", traceback.format_exc())
+        return None
+
+
+async def confirm_transaction(tx_hash, timeout=RECEIPT_TIMEOUT):
+    """
+    Wait for a broadcast transaction to be mined.
+    
+    If the transaction is not mined in time it was most likely dropped, which
+    leaves a gap at its nonce, so the sender's local nonce is reset.
+    
+    Returns:
+        True if it was mined successfully, False if it reverted or timed out
+    """
+    tx_hash = _tx_hash_hex(tx_hash)
+    sender = _tx_senders.pop(tx_hash, None)
+    
+    try:
+        receipts = await _wait_for_receipts([tx_hash], timeout)
+        if int(receipts[tx_hash]["status"], 16) != 1:
+            logger.error("Transaction %s reverted", tx_hash)
+            return False
+        return True
+
+    except TimeoutError:
+        # The sender is unknown after a restart; re-read every nonce then
+        for address in [sender] if sender else list(_nonces):
+            _reset_nonce(address)
+        logger.error("Transaction %s was not mined within %ss", tx_hash, timeout)
+        return False
+
+    except Exception:
+        logger.error("Error confirming transaction %s:\n%s", tx_hash, traceback.format_exc())
         return False
 
 
@@ -132,8 +455,9 @@ async def submit_cmc(name, symbol, contract_address, logo_path):
     Submit a coin to CoinMarketCap (mocked version).
     """
     try:
-        await asyncio.sleep(2)  # Simulate delay
-        logger.info(f"Submitted {name} ({symbol}) to CMC")
+        if CMC_SIMULATE_DELAY:
+            await asyncio.sleep(CMC_SIMULATE_DELAY)  # Simulate delay
+        logger.info("Submitted %s (%s) to CMC", name, symbol)
         return True
 
     except Exception:
@@ -141,42 +465,260 @@ async def submit_cmc(name, symbol, contract_address, logo_path):
         return False
 
 
-async def verify_payment(wallet_address, expected_amount, reference):
+async def _bscscan_rate_limit():
     """
-    Verify a payment on the blockchain.
+    Wait for a token from the BSCScan bucket (BSCSCAN_RATE_LIMIT per second).
+    """
+    global _bscscan_tokens, _bscscan_refilled_at
+    
+    async with _bscscan_rate_lock:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            _bscscan_tokens = min(
+                BSCSCAN_RATE_LIMIT,
+                _bscscan_tokens + (now - _bscscan_refilled_at) * BSCSCAN_RATE_LIMIT
+            )
+            _bscscan_refilled_at = now
+            if _bscscan_tokens >= 1:
+                _bscscan_tokens -= 1
+                return
+            await asyncio.sleep((1 - _bscscan_tokens) / BSCSCAN_RATE_LIMIT)
+
+
+async def _lookback_start_block():
+    """
+    Get a block mined at least PAYMENT_MAX_AGE seconds ago to start scans from.
     """
+    global _lookback_block
+    
+    if _lookback_block is not None and time.monotonic() - _lookback_block[0] < BLOCK_BY_TIME_CACHE_TTL:
+        return _lookback_block[1]
+    
+    # Look back a little further so the block stays old enough while cached
+    params = {
+        "module": "block",
+        "action": "getblocknobytime",
+        "timestamp": int(time.time()) - PAYMENT_MAX_AGE - BLOCK_BY_TIME_CACHE_TTL,
+        "closest": "before",
+        "apikey": BSC_API_KEY or ""
+    }
+    
     try:
-        expected_wei = w3.to_wei(expected_amount, 'ether')
-        current_time = datetime.now()
-        one_hour_ago = current_time - timedelta(hours=1)
-
-        api_url = "https://api.bscscan.com/api"
-        params = {
-            "module": "account",
-            "action": "txlist",
-            "address": wallet_address,
-            "startblock": 0,
-            "endblock": 99999999,
-            "sort": "desc",
-            "apikey": BSC_API_KEY
-        }
-
-        response = requests.get(api_url, params=params)
-        data = response.json()
-
-        if data.get("status") != "1":
-            logger.error(f"BSCScan API error: {data.get('message')}")
-            return False
+        async with _bscscan_semaphore:
+            await _bscscan_rate_limit()
+            session = await _get_session()
+            async with session.get(
+                BSCSCAN_API_URL,
+                params=params,
+                timeout=aiohttp.ClientTimeout(total=BSCSCAN_TIMEOUT)
+            ) as response:
+                data = orjson.loads(await response.read())
+        
+        if data.get("status") == "1":
+            _lookback_block = (time.monotonic(), int(data["result"]))
+            return _lookback_block[1]
+        logger.warning("BSCScan block lookup failed: %s", data.get("message"))
+    except (aiohttp.ClientError, asyncio.TimeoutError, orjson.JSONDecodeError, ValueError) as e:
+        logger.warning("BSCScan block lookup failed: %s", e)
+    
+    return max(0, await w3.eth.block_number - BSCSCAN_FALLBACK_LOOKBACK_BLOCKS)
+
+
+async def _fetch_txlist(wallet_address, start_block, page):
+    """
+    Fetch one page of a wallet's transactions from BSCScan, newest first.
+    
+    Pages are cached for TXLIST_CACHE_TTL seconds and concurrent requests for
+    the same wallet share one fetch. A cached page fetched from an earlier
+    start block is reused, since it holds every newer transaction too.
+    
+    Returns:
+        The list of transactions, or None on an API error
+    """
+    cache_key = (wallet_address.lower(), page)
+    lock = _txlist_locks.setdefault(cache_key[0], asyncio.Lock())
+    
+    async with lock:
+        cached = _txlist_cache.get(cache_key)
+        if cached is not None:
+            fetched_at, cached_start_block, txs = cached
+            if time.monotonic() - fetched_at < TXLIST_CACHE_TTL and cached_start_block <= start_block:
+                return txs
+        
+        txs = await _request_txlist(wallet_address, start_block, page)
+        if txs is not None:
+            _txlist_cache[cache_key] = (time.monotonic(), start_block, txs)
+        return txs
+
+
+async def _request_txlist(wallet_address, start_block, page):
+    """
+    Request one page of a wallet's transactions from the BSCScan API.
+    
+    Returns:
+        The list of transactions, or None on an API error
+    """
+    params = {
+        **BSCSCAN_TXLIST_PARAMS,
+        "address": wallet_address,
+        "startblock": start_block,
+        "page": page
+    }
+
+    async with _bscscan_semaphore:
+        await _bscscan_rate_limit()
+        session = await _get_session()
+        async with session.get(
+            BSCSCAN_API_URL,
+            params=params,
+            timeout=aiohttp.ClientTimeout(total=BSCSCAN_TIMEOUT)
+        ) as response:
+            data = orjson.loads(await response.read())
+
+    # An empty result is reported as status 0 but is not an error
+    if data.get("status") != "1" and data.get("result") != []:
+        logger.error("BSCScan API error: %s", data.get("message"))
+        return None
+
+    return data["result"]
 
-        for tx in data["result"]:
-            tx_time = datetime.fromtimestamp(int(tx["timeStamp"]))
-            if tx_time < one_hour_ago:
-                continue
 
-            if tx["to"].lower() == wallet_address.lower() and int(tx["value"]) >= expected_wei:
+def encode_reference(reference):
+    """
+    Encode a payment reference as the bytes32 passed to PaymentReceiver.pay().
+    """
+    return reference.encode().ljust(32, b"\0")
+
+
+async def _block_at_time(timestamp):
+    """
+    Find the first block mined at or after timestamp by binary search over block headers.
+    """
+    low, high = 0, await w3.eth.block_number
+    while low < high:
+        mid = (low + high) // 2
+        if (await w3.eth.get_block(mid))["timestamp"] < timestamp:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+async def _verify_payment_logs(expected_wei, reference, since):
+    """
+    Look a payment up by its reference in the PaymentReceiver event logs.
+    
+    The first lookup for a reference starts at the block mined at since (the
+    coin's creation time); later ones continue from the watermark stored in
+    the database. Blocks are queried PAYMENT_LOGS_CHUNK_BLOCKS at a time.
+    """
+    latest = await w3.eth.block_number
+    from_block = get_payment_scan_block(reference)
+    if from_block is None:
+        from_block = await _block_at_time(since - PAYMENT_CLOCK_MARGIN)
+    
+    while from_block <= latest:
+        to_block = min(from_block + PAYMENT_LOGS_CHUNK_BLOCKS - 1, latest)
+        logs = await w3.eth.get_logs({
+            "address": AsyncWeb3.to_checksum_address(PAYMENT_RECEIVER),
+            "topics": [PAYMENT_EVENT_TOPIC, None, AsyncWeb3.to_hex(encode_reference(reference))],
+            "fromBlock": from_block,
+            "toBlock": to_block
+        })
+        
+        for log in logs:
+            if int.from_bytes(log["data"], "big") >= expected_wei:
+                delete_payment_scan(reference)
                 return True
+        
+        # Keep the progress so a restart doesn't rescan these blocks
+        from_block = to_block + 1
+        save_payment_scan_block(reference, from_block)
+    
+    return False
 
-        return False
+
+def _store_verification(cache_key, verified, last_block):
+    """
+    Record a verification result in the payment verification cache.
+    """
+    if verified:
+        # Settled payments are not re-checked, so drop the entry
+        _verify_cache.pop(cache_key, None)
+    else:
+        _verify_cache[cache_key] = (time.monotonic(), False, last_block)
+        _verify_cache.move_to_end(cache_key)
+        if len(_verify_cache) > VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+
+
+async def verify_payment(wallet_address, expected_amount, reference, since=None):
+    """
+    Verify a payment on the blockchain.
+    
+    since is the Unix time the payment reference was created at; receiver
+    contract lookups scan from then, or from PAYMENT_MAX_AGE ago if it is None.
+    """
+    try:
+        expected_wei = _to_wei(expected_amount)
+        wallet_lower = wallet_address.lower()
+        cache_key = (wallet_lower, reference, expected_wei)
+        
+        # Answer repeated clicks from the cache while the last result is fresh
+        cached = _verify_cache.get(cache_key)
+        if cached is not None:
+            checked_at, verified, last_block = cached
+            if time.monotonic() - checked_at < VERIFY_CACHE_TTL:
+                _verify_cache.move_to_end(cache_key)
+                return verified
+        
+        # Payments made through the receiver contract can be matched by reference;
+        # that path tracks its own block watermark in the database
+        if PAYMENT_RECEIVER:
+            if since is None:
+                since = int(time.time()) - PAYMENT_MAX_AGE
+            verified = await _verify_payment_logs(expected_wei, reference, since)
+            _store_verification(cache_key, verified, None)
+            return verified
+        
+        if cached is None:
+            # First check: only scan blocks from about the last hour
+            last_block = await _lookback_start_block() - 1
+        
+        one_hour_ago = int(time.time()) - PAYMENT_MAX_AGE
+        newest_block = last_block
+
+        # Walk the newest transactions page by page and stop at the first one older than an hour
+        verified = False
+        page = 1
+        while True:
+            txs = await _fetch_txlist(wallet_address, last_block + 1, page)
+            if txs is None:
+                return False
+
+            # Pages are sorted newest first, so the first row has the newest block
+            if page == 1 and txs:
+                newest_block = max(newest_block, int(txs[0]["blockNumber"]))
+
+            done = len(txs) < BSCSCAN_PAGE_SIZE
+            for tx in txs:
+                if int(tx["timeStamp"]) < one_hour_ago:
+                    done = True
+                    break
+
+                # Compare the amount first; most transactions fail that cheaper check
+                if int(tx["value"]) >= expected_wei and tx["to"].lower() == wallet_lower:
+                    verified = done = True
+                    break
+
+            if done:
+                break
+            page += 1
+
+        # Only blocks after newest_block need scanning on the next check
+        _store_verification(cache_key, verified, newest_block)
+        return verified
 
     except Exception:
         logger.error("Error verifying payment:\n%s", traceback.format_exc())
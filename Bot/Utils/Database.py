@@ -5,20 +5,192 @@ Handles database operations for storing coin information.
 """
 
 import os
+import time
+import queue
+import asyncio
 import sqlite3
 import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # Database file path
 DB_PATH = os.path.join(os.path.dirname(__file__), '../../database/memecoin.db')
 
+# Connection pool settings (1 writer + N readers)
+READER_POOL_SIZE = 4
+
+# Pragmas applied to every pooled connection
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+@dataclass(slots=True)
+class CoinView:
+    """
+    The coin fields the handlers read, with attribute access.
+    """
+    id: int
+    name: str
+    symbol: str
+    contract_address: str
+    ref_id: str
+    trading_enabled: bool = False
+    cmc_submitted: bool = False
+    logo_path: str = None
+    created_at: int = None  # Unix time
+
+# Columns selected for CoinView, in field order
+COIN_SUMMARY_COLUMNS = "id, name, symbol, contract_address, ref_id, trading_enabled, cmc_submitted"
+COIN_COLUMNS = COIN_SUMMARY_COLUMNS + ", logo_path, CAST(strftime('%s', created_at) AS INTEGER)"
+
+# SQL statements, kept as constants so each pooled connection's statement
+# cache reuses the prepared statement instead of re-parsing it
+STATEMENT_CACHE_SIZE = 256
+
+INSERT_COIN_SQL = '''
+INSERT INTO coins (user_id, name, symbol, supply, logo_path, contract_address, ref_id, trading_enabled)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SELECT_COIN_SQL = f'''
+SELECT {COIN_COLUMNS} FROM coins WHERE user_id = ? ORDER BY created_at DESC LIMIT 1
+'''
+
+SELECT_COIN_SUMMARY_SQL = f'''
+SELECT {COIN_SUMMARY_COLUMNS} FROM coins WHERE user_id = ? ORDER BY created_at DESC LIMIT 1
+'''
+
+UPDATE_COIN_STATUS_SQL = '''
+UPDATE coins
+SET trading_enabled = COALESCE(?, trading_enabled), cmc_submitted = COALESCE(?, cmc_submitted)
+WHERE user_id = ? AND contract_address = ?
+'''
+
+INSERT_TRANSACTION_SQL = '''
+INSERT INTO transactions (user_id, coin_id, tx_type, tx_hash, amount, status)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+UPDATE_TRANSACTION_STATUS_SQL = '''
+UPDATE transactions SET status = ? WHERE tx_hash = ?
+'''
+
+SELECT_PENDING_TRANSACTIONS_SQL = '''
+SELECT t.user_id, c.contract_address, t.tx_hash
+FROM transactions t JOIN coins c ON c.id = t.coin_id
+WHERE t.tx_type = ? AND t.status = 'pending'
+'''
+
+SELECT_PENDING_TRANSACTION_SQL = '''
+SELECT 1 FROM transactions WHERE coin_id = ? AND tx_type = ? AND status = 'pending' LIMIT 1
+'''
+
+SELECT_SHILL_SQL = '''
+SELECT text FROM shill_cache WHERE contract_address = ? AND created_at >= ?
+'''
+
+SAVE_SHILL_SQL = '''
+INSERT OR REPLACE INTO shill_cache (contract_address, text, created_at)
+VALUES (?, ?, ?)
+'''
+
+SELECT_PAYMENT_SCAN_SQL = '''
+SELECT next_block FROM payment_scans WHERE reference = ?
+'''
+
+SAVE_PAYMENT_SCAN_SQL = '''
+INSERT OR REPLACE INTO payment_scans (reference, next_block)
+VALUES (?, ?)
+'''
+
+DELETE_PAYMENT_SCAN_SQL = '''
+DELETE FROM payment_scans WHERE reference = ?
+'''
+
+# Coin status updates are buffered briefly and written in one transaction
+STATUS_FLUSH_INTERVAL = 0.02
+STATUS_BATCH_SIZE = 256
+_pending_status = []  # ((trading_enabled, cmc_submitted, user_id, contract_address), future)
+_status_lock = asyncio.Lock()
+_status_flush_task = None
+
+_reader_pool = queue.Queue(maxsize=READER_POOL_SIZE)
+_reader_count = 0
+_reader_count_lock = threading.Lock()
+_writer_conn = None
+_writer_lock = threading.Lock()
+
+def _open_connection():
+    """
+    Open a new connection with the pool pragmas applied.
+    """
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+@contextmanager
+def get_reader():
+    """
+    Borrow a read connection from the pool.
+    
+    Readers never block each other or the writer thanks to WAL mode.
+    Connections are opened lazily up to READER_POOL_SIZE.
+    """
+    global _reader_count
+    
+    conn = None
+    with _reader_count_lock:
+        if _reader_pool.empty() and _reader_count < READER_POOL_SIZE:
+            conn = _open_connection()
+            _reader_count += 1
+    
+    if conn is None:
+        conn = _reader_pool.get()
+    
+    try:
+        yield conn
+    finally:
+        _reader_pool.put(conn)
+
+@contextmanager
+def get_writer():
+    """
+    Borrow the single write connection inside a BEGIN IMMEDIATE transaction.
+    
+    The transaction is committed on success and rolled back on error.
+    """
+    global _writer_conn
+    
+    with _writer_lock:
+        if _writer_conn is None:
+            _writer_conn = _open_connection()
+        
+        _writer_conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield _writer_conn
+        except Exception:
+            _writer_conn.execute("ROLLBACK")
+            raise
+        else:
+            _writer_conn.execute("COMMIT")
+
 def setup_database():
     """
     Set up the database and create tables if they don't exist.
@@ -27,50 +199,76 @@ def setup_database():
         # Ensure the database directory exists
         os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
         
-        # Connect to database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Create coins table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS coins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            symbol TEXT NOT NULL,
-            supply INTEGER NOT NULL,
-            logo_path TEXT NOT NULL,
-            contract_address TEXT NOT NULL,
-            ref_id TEXT NOT NULL,
-            trading_enabled BOOLEAN DEFAULT 0,
-            cmc_submitted BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # Create transactions table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            coin_id INTEGER NOT NULL,
-            tx_type TEXT NOT NULL,
-            tx_hash TEXT NOT NULL,
-            amount REAL NOT NULL,
-            status TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (coin_id) REFERENCES coins (id)
-        )
-        ''')
-        
-        # Commit changes and close connection
-        conn.commit()
-        conn.close()
+        # Create the schema in one transaction; the writer connection has
+        # already switched the database file to WAL
+        with get_writer() as conn:
+            # Create coins table
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS coins (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                supply INTEGER NOT NULL,
+                logo_path TEXT NOT NULL,
+                contract_address TEXT NOT NULL,
+                ref_id TEXT NOT NULL,
+                trading_enabled BOOLEAN DEFAULT 0,
+                cmc_submitted BOOLEAN DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            
+            # Create transactions table
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                coin_id INTEGER NOT NULL,
+                tx_type TEXT NOT NULL,
+                tx_hash TEXT NOT NULL,
+                amount REAL NOT NULL,
+                status TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (coin_id) REFERENCES coins (id)
+            )
+            ''')
+            
+            # Index the latest-coin lookup and the status update's WHERE clause
+            conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_coins_user_created ON coins (user_id, created_at DESC)
+            ''')
+            conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_coins_user_contract ON coins (user_id, contract_address)
+            ''')
+            conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions (user_id, created_at DESC)
+            ''')
+            conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_hash ON transactions (tx_hash)
+            ''')
+            
+            # Create shill message cache table
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS shill_cache (
+                contract_address TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                created_at INTEGER NOT NULL
+            )
+            ''')
+            
+            # Create payment event scan progress table (next block per payment reference)
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS payment_scans (
+                reference TEXT PRIMARY KEY,
+                next_block INTEGER NOT NULL
+            )
+            ''')
         
         logger.info("Database setup complete")
         
     except Exception as e:
-        logger.error(f"Error setting up database: {e}")
+        logger.error("Error setting up database: %s", e)
 
 def add_new_coin(user_id, name, symbol, supply, logo_path, contract_address, ref_id, trading_enabled=False):
     """
@@ -90,28 +288,18 @@ def add_new_coin(user_id, name, symbol, supply, logo_path, contract_address, ref
         The coin ID if successful, None otherwise
     """
     try:
-        # Connect to database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Insert new coin
-        cursor.execute('''
-        INSERT INTO coins (user_id, name, symbol, supply, logo_path, contract_address, ref_id, trading_enabled)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, name, symbol, supply, logo_path, contract_address, ref_id, trading_enabled))
-        
-        # Get the coin ID
-        coin_id = cursor.lastrowid
-        
-        # Commit changes and close connection
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"Added new coin {name} ({symbol}) for user {user_id}")
+        # Insert new coin; the transaction commits when the block exits
+        with get_writer() as conn:
+            cursor = conn.execute(INSERT_COIN_SQL, (user_id, name, symbol, supply, logo_path, contract_address, ref_id, trading_enabled))
+            
+            # Get the coin ID
+            coin_id = cursor.lastrowid
+        
+        logger.info("Added new coin %s (%s) for user %s", name, symbol, user_id)
         return coin_id
         
     except Exception as e:
-        logger.error(f"Error adding new coin: {e}")
+        logger.error("Error adding new coin: %s", e)
         return None
 
 def get_user_coin(user_id):
@@ -122,38 +310,93 @@ def get_user_coin(user_id):
         user_id: The Telegram user ID
         
     Returns:
-        The coin data as a dictionary if found, None otherwise
+        The coin as a CoinView if found, None otherwise
     """
     try:
-        # Connect to database
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-        cursor = conn.cursor()
-        
         # Get the user's coin
-        cursor.execute('''
-        SELECT * FROM coins WHERE user_id = ? ORDER BY created_at DESC LIMIT 1
-        ''', (user_id,))
+        with get_reader() as conn:
+            row = conn.execute(SELECT_COIN_SQL, (user_id,)).fetchone()
         
-        # Fetch the result
-        row = cursor.fetchone()
+        if row:
+            return CoinView(*row)
+        else:
+            return None
+        
+    except Exception as e:
+        logger.error("Error getting user coin: %s", e)
+        return None
+
+def get_user_coin_summary(user_id):
+    """
+    Get the columns the bot's menus need for a user's coin.
+    
+    Args:
+        user_id: The Telegram user ID
         
-        # Close connection
-        conn.close()
+    Returns:
+        The coin as a CoinView without logo_path if found, None otherwise
+    """
+    try:
+        # Get the user's coin
+        with get_reader() as conn:
+            row = conn.execute(SELECT_COIN_SUMMARY_SQL, (user_id,)).fetchone()
         
         if row:
-            return dict(row)
+            return CoinView(*row)
         else:
             return None
         
     except Exception as e:
-        logger.error(f"Error getting user coin: {e}")
+        logger.error("Error getting user coin summary: %s", e)
         return None
 
-def update_coin_status(user_id, contract_address, trading_enabled=None, cmc_submitted=None):
+def _write_coin_status(batch):
+    """
+    Apply a batch of coin status updates in a single transaction.
+    """
+    with get_writer() as conn:
+        conn.executemany(UPDATE_COIN_STATUS_SQL, batch)
+
+async def _flush_coin_status():
+    """
+    Write all pending coin status updates and resolve their waiters.
+    """
+    async with _status_lock:
+        pending = _pending_status[:]
+        _pending_status.clear()
+    
+    if not pending:
+        return
+    
+    try:
+        await asyncio.to_thread(_write_coin_status, [params for params, _ in pending])
+        logger.debug("Updated coin status for %d coin(s)", len(pending))
+        success = True
+    except Exception as e:
+        logger.error("Error updating coin status: %s", e)
+        success = False
+    
+    for _, future in pending:
+        if not future.done():
+            future.set_result(success)
+
+async def _flush_coin_status_later():
+    """
+    Flush the pending coin status updates once the batching window has passed.
+    """
+    global _status_flush_task
+    
+    await asyncio.sleep(STATUS_FLUSH_INTERVAL)
+    _status_flush_task = None
+    await _flush_coin_status()
+
+async def update_coin_status(user_id, contract_address, trading_enabled=None, cmc_submitted=None):
     """
     Update a coin's status in the database.
     
+    Updates arriving within STATUS_FLUSH_INTERVAL of each other are written
+    together in one transaction; this returns once the batch is committed.
+    
     Args:
         user_id: The Telegram user ID
         contract_address: The contract address
@@ -163,80 +406,242 @@ def update_coin_status(user_id, contract_address, trading_enabled=None, cmc_subm
     Returns:
         True if successful, False otherwise
     """
-    try:
-        # Connect to database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Build the update query
-        query = "UPDATE coins SET "
-        params = []
+    global _status_flush_task
+    
+    # Nothing to change, so skip the write entirely
+    if trading_enabled is None and cmc_submitted is None:
+        return True
+    
+    future = asyncio.get_running_loop().create_future()
+    
+    async with _status_lock:
+        _pending_status.append(((trading_enabled, cmc_submitted, user_id, contract_address), future))
+        batch_full = len(_pending_status) >= STATUS_BATCH_SIZE
+        if not batch_full and _status_flush_task is None:
+            _status_flush_task = asyncio.create_task(_flush_coin_status_later())
+    
+    if batch_full:
+        await _flush_coin_status()
+    
+    return await future
+
+def add_transaction(user_id, coin_id, tx_type, tx_hash, amount, status):
+    """
+    Add a new transaction to the database.
+    
+    Args:
+        user_id: The Telegram user ID
+        coin_id: The coin ID
+        tx_type: The transaction type (unlock, cmc, etc.)
+        tx_hash: The transaction hash
+        amount: The transaction amount
+        status: The transaction status
         
-        if trading_enabled is not None:
-            query += "trading_enabled = ?, "
-            params.append(trading_enabled)
+    Returns:
+        The transaction ID if successful, None otherwise
+    """
+    try:
+        # Insert new transaction; the transaction commits when the block exits
+        with get_writer() as conn:
+            cursor = conn.execute(INSERT_TRANSACTION_SQL, (user_id, coin_id, tx_type, tx_hash, amount, status))
+            
+            # Get the transaction ID
+            tx_id = cursor.lastrowid
+        
+        logger.debug("Added new transaction %s for user %s", tx_hash, user_id)
+        return tx_id
         
-        if cmc_submitted is not None:
-            query += "cmc_submitted = ?, "
-            params.append(cmc_submitted)
+    except Exception as e:
+        logger.error("Error adding new transaction: %s", e)
+        return None
+
+def add_transactions(rows):
+    """
+    Add several transactions to the database in a single transaction.
+    
+    Args:
+        rows: An iterable of (user_id, coin_id, tx_type, tx_hash, amount, status) tuples
         
-        # Remove the trailing comma and space
-        query = query.rstrip(", ")
+    Returns:
+        The number of transactions added, or None on error
+    """
+    try:
+        # Insert all rows; the transaction commits when the block exits
+        with get_writer() as conn:
+            cursor = conn.executemany(INSERT_TRANSACTION_SQL, rows)
+            count = cursor.rowcount
         
-        # Add the WHERE clause
-        query += " WHERE user_id = ? AND contract_address = ?"
-        params.extend([user_id, contract_address])
+        logger.debug("Added %d new transactions", count)
+        return count
         
-        # Execute the update
-        cursor.execute(query, params)
+    except Exception as e:
+        logger.error("Error adding new transactions: %s", e)
+        return None
+
+def update_transaction_status(tx_hash, status):
+    """
+    Update the status of a recorded transaction.
+    
+    Args:
+        tx_hash: The transaction hash
+        status: The new status (pending, confirmed, failed)
         
-        # Commit changes and close connection
-        conn.commit()
-        conn.close()
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        with get_writer() as conn:
+            conn.execute(UPDATE_TRANSACTION_STATUS_SQL, (status, tx_hash))
         
-        logger.info(f"Updated coin status for user {user_id}, contract {contract_address}")
+        logger.debug("Transaction %s is now %s", tx_hash, status)
         return True
         
     except Exception as e:
-        logger.error(f"Error updating coin status: {e}")
+        logger.error("Error updating transaction status: %s", e)
         return False
 
-def add_transaction(user_id, coin_id, tx_type, tx_hash, amount, status):
+def get_pending_transactions(tx_type):
     """
-    Add a new transaction to the database.
+    Get the transactions of a type that are still waiting for confirmation.
+    
+    Args:
+        tx_type: The transaction type (unlock, cmc, etc.)
+        
+    Returns:
+        A list of (user_id, contract_address, tx_hash) tuples
+    """
+    try:
+        with get_reader() as conn:
+            rows = conn.execute(SELECT_PENDING_TRANSACTIONS_SQL, (tx_type,)).fetchall()
+        
+        return [tuple(row) for row in rows]
+        
+    except Exception as e:
+        logger.error("Error getting pending transactions: %s", e)
+        return []
+
+def has_pending_transaction(coin_id, tx_type):
+    """
+    Check whether a coin has a transaction of a type waiting for confirmation.
     
     Args:
-        user_id: The Telegram user ID
         coin_id: The coin ID
         tx_type: The transaction type (unlock, cmc, etc.)
-        tx_hash: The transaction hash
-        amount: The transaction amount
-        status: The transaction status
         
     Returns:
-        The transaction ID if successful, None otherwise
+        True if one is pending, False otherwise
     """
     try:
-        # Connect to database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        with get_reader() as conn:
+            row = conn.execute(SELECT_PENDING_TRANSACTION_SQL, (coin_id, tx_type)).fetchone()
         
-        # Insert new transaction
-        cursor.execute('''
-        INSERT INTO transactions (user_id, coin_id, tx_type, tx_hash, amount, status)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, coin_id, tx_type, tx_hash, amount, status))
+        return row is not None
         
-        # Get the transaction ID
-        tx_id = cursor.lastrowid
+    except Exception as e:
+        logger.error("Error checking pending transactions: %s", e)
+        return False
+
+def get_cached_shill(contract_address, max_age):
+    """
+    Get a previously generated shill message for a coin.
+    
+    Args:
+        contract_address: The contract address
+        max_age: The maximum age of the message in seconds
         
-        # Commit changes and close connection
-        conn.commit()
-        conn.close()
+    Returns:
+        The message text if a fresh one is cached, None otherwise
+    """
+    try:
+        # Get the cached message if it is still fresh
+        with get_reader() as conn:
+            row = conn.execute(SELECT_SHILL_SQL, (contract_address, int(time.time()) - max_age)).fetchone()
         
-        logger.info(f"Added new transaction {tx_hash} for user {user_id}")
-        return tx_id
+        return row[0] if row else None
         
     except Exception as e:
-        logger.error(f"Error adding new transaction: {e}")
+        logger.error("Error getting cached shill message: %s", e)
         return None
+
+def save_shill(contract_address, text):
+    """
+    Cache a generated shill message for a coin, replacing any older one.
+    
+    Args:
+        contract_address: The contract address
+        text: The generated message
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        # Insert or replace the cached message
+        with get_writer() as conn:
+            conn.execute(SAVE_SHILL_SQL, (contract_address, text, int(time.time())))
+        
+        return True
+        
+    except Exception as e:
+        logger.error("Error saving shill message: %s", e)
+        return False
+
+def get_payment_scan_block(reference):
+    """
+    Get the next block to scan for a payment reference's events.
+    
+    Args:
+        reference: The payment reference
+        
+    Returns:
+        The block number, or None if the reference was never scanned
+    """
+    try:
+        with get_reader() as conn:
+            row = conn.execute(SELECT_PAYMENT_SCAN_SQL, (reference,)).fetchone()
+        
+        return row[0] if row else None
+        
+    except Exception as e:
+        logger.error("Error getting payment scan progress: %s", e)
+        return None
+
+def save_payment_scan_block(reference, next_block):
+    """
+    Record the next block to scan for a payment reference's events.
+    
+    Args:
+        reference: The payment reference
+        next_block: The first block not scanned yet
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        with get_writer() as conn:
+            conn.execute(SAVE_PAYMENT_SCAN_SQL, (reference, next_block))
+        
+        return True
+        
+    except Exception as e:
+        logger.error("Error saving payment scan progress: %s", e)
+        return False
+
+def delete_payment_scan(reference):
+    """
+    Forget the scan progress of a payment reference once it is paid.
+    
+    Args:
+        reference: The payment reference
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        with get_writer() as conn:
+            conn.execute(DELETE_PAYMENT_SCAN_SQL, (reference,))
+        
+        return True
+        
+    except Exception as e:
+        logger.error("Error deleting payment scan progress: %s", e)
+        return False
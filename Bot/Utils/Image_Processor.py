@@ -6,40 +6,98 @@ Image Processor Module
 Handles image processing for coin logos.
 """
 
-import io
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
-def compress_image(image_bytes, target_size=(512, 512), format="PNG"):
+# Upload limits checked from the image header before decoding
+MAX_IMAGE_PIXELS = 4096 * 4096
+ALLOWED_FORMATS = frozenset({"PNG", "JPEG", "WEBP"})
+
+# Worker threads for image work, kept apart from the default executor so a
+# burst of uploads can't starve the other to_thread() users
+_image_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="image")
+
+# How far above the target size JPEG decoding and box reduction may stop
+THUMBNAIL_REDUCING_GAP = 2.0
+
+# Encoder options per output format; PNG uses a fixed zlib level instead of
+# optimize=True, which retries several compression settings
+SAVE_OPTIONS = {
+    "PNG": {"compress_level": 6},
+    "JPEG": {"quality": 85},
+    "WEBP": {"quality": 85, "method": 4},
+}
+
+def is_valid_image(image_path):
+    """
+    Check an image's format and dimensions without decoding its pixels.
+    
+    Args:
+        image_path: The path to the image
+        
+    Returns:
+        True if the image can be processed, False otherwise
+    """
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+            return image.format in ALLOWED_FORMATS and width * height <= MAX_IMAGE_PIXELS
+    except (OSError, Image.DecompressionBombError):
+        return False
+
+def compress_image(image_path, output_path, target_size=(512, 512), format="PNG"):
     """
-    Compress and resize an image to the target size.
+    Compress and downscale an image file to fit within the target size.
     
     Args:
-        image_bytes: The image as bytes
+        image_path: The path to the source image
+        output_path: The path to write the compressed image to
         target_size: The target size as (width, height)
         format: The output format (PNG, JPEG, etc.)
         
     Returns:
-        The compressed image as bytes
+        The output path
+    """
+    # Open the image lazily (only the header is read until pixels are needed)
+    image = Image.open(image_path)
+    
+    # Downscale in place, keeping the aspect ratio. For JPEG sources,
+    # thumbnail() first calls draft() so libjpeg decodes at a reduced scale;
+    # reducing_gap keeps that scale at least twice the target for quality
+    image.thumbnail(target_size, Image.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+    
+    # Pillow only knows JPEG files by the "JPEG" format name
+    fmt = "JPEG" if format.upper() in ("JPEG", "JPG") else format.upper()
+    
+    if fmt == "JPEG":
+        # JPEG has no alpha channel, so flatten transparency onto white
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            # Create a white background
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            # Paste the image on the background using alpha as mask
+            background.paste(image, mask=image.split()[3])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        # PNG and WebP keep transparency as is
+        image = image.convert('RGBA')
+    
+    # Save the image straight to its final location
+    image.save(output_path, format=fmt, **SAVE_OPTIONS.get(fmt, {}))
+    
+    return output_path
+
+async def compress_image_async(image_path, output_path, target_size=(512, 512), format="PNG"):
+    """
+    Run compress_image on the image worker pool without blocking the event loop.
+    
+    Returns:
+        The output path
     """
-    # Open the image from bytes
-    image = Image.open(io.BytesIO(image_bytes))
-    
-    # Convert to RGB if needed (removing alpha channel)
-    if image.mode == 'RGBA':
-        # Create a white background
-        background = Image.new('RGB', image.size, (255, 255, 255))
-        # Paste the image on the background using alpha as mask
-        background.paste(image, mask=image.split()[3])
-        image = background
-    elif image.mode != 'RGB':
-        image = image.convert('RGB')
-    
-    # Resize the image
-    image = image.resize(target_size, Image.LANCZOS)
-    
-    # Save the image to bytes
-    output = io.BytesIO()
-    image.save(output, format=format, optimize=True, quality=85)
-    output.seek(0)
-    
-    return output.getvalue()
+    return await asyncio.get_running_loop().run_in_executor(
+        _image_pool, compress_image, image_path, output_path, target_size, format
+    )
@@ -0,0 +1,22 @@
+# Copyright ©️ 2025 THEETOX
+"""
+Logger Module
+Configures logging once for every module of the bot.
+"""
+
+import logging
+from Bot.Config import LOG_LEVEL
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def setup_logging():
+    """
+    Configure the root logger.
+    
+    Modules only call logging.getLogger(__name__); handlers and levels are
+    set here, from the bot's entry point.
+    """
+    logging.basicConfig(format=LOG_FORMAT, level=LOG_LEVEL)
+    
+    # httpx logs every Telegram API request (including each poll) at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -28,6 +28,8 @@ DEV_WALLET=your_dev_wallet_address_here
 MARKETING_WALLET=your_marketing_wallet_address_here
 LIQUIDITY_WALLET=your_liquidity_wallet_address_here
 PAYMENT_WALLET=your_payment_wallet_address_here
+# Optional: PaymentReceiver contract address to verify payments by reference
+# PAYMENT_RECEIVER=
 
 # Deployer Private Key (Keep this secure!)
 DEPLOYER_PRIVATE_KEY=your_deployer_private_key_here
@@ -43,6 +45,10 @@ echo "Compiling smart contract..."
 # This is a placeholder - in a real deployment, you would use truffle or hardhat
 # npx truffle compile
 
+# Keep only the ABI and bytecode the bot loads from the compiler artifact
+python -c "import json; d = json.load(open('Bot/Contracts/MemeCoin.json')); json.dump({'abi': d['abi'], 'bytecode': d['bytecode']}, open('Bot/Contracts/MemeCoin.min.json', 'w'), separators=(',', ':'))" \
+    || echo "Could not strip MemeCoin.json; the full artifact will be loaded instead."
+
 # Initialize the database
 echo "Initializing database..."
 python -c "from bot.utils.database import setup_database; setup_database()"